@@ -0,0 +1,141 @@
+# //////////////////////////////////////////////////////////////
+# //////////////////////////////////////////////////////////////
+# BUNDLE INDEX
+#
+# Finding a bundle by name (or the bundle an image is in) means searching the whole
+# image list, so an index of both is kept alongside it.  It's rebuilt whenever the
+# list is refreshed.
+#
+# Anything can change the list without going through PakPal (undo, loading a file,
+# scripts), so every lookup is checked against the list and the index is rebuilt
+# if it's out of date.
+#
+# The multi-select selection is cached here too, for the same reason.
+
+class BundleIndex():
+    """
+    Maps bundle names to their index in the image list, and images to the bundle
+    they're in.
+    """
+
+    def __init__(self):
+        self.names = {}
+        self.images = {}
+
+    def rebuild(self, bundles):
+        self.names = {}
+        self.images = {}
+
+        for i, bundle in enumerate(bundles):
+            self.names[bundle.name] = i
+
+            for item in bundle.pak_items:
+                if item.tex is not None:
+                    self.images[item.tex.name_full] = bundle.name
+
+    def add_image(self, image, bundle):
+        self.images[image.name_full] = bundle.name
+
+    def is_valid(self, bundles, name, index):
+        return index < len(bundles) and bundles[index].name == name
+
+    def find(self, bundles, name):
+        """
+        Returns the index of the bundle with the given name, or -1 if there isn't one.
+        """
+
+        index = self.names.get(name, -1)
+        if index != -1 and self.is_valid(bundles, name, index):
+            return index
+
+        self.rebuild(bundles)
+        return self.names.get(name, -1)
+
+    def get_bundle(self, bundles, name):
+        """
+        Returns the bundle with the given name, or None if there isn't one.
+        """
+
+        index = self.find(bundles, name)
+        if index == -1:
+            return None
+        return bundles[index]
+
+    def get_image_bundle(self, bundles, image):
+        """
+        Returns the bundle the image is in, or None if it isn't in one.
+        """
+
+        for attempt in range(2):
+            name = self.images.get(image.name_full)
+            index = self.names.get(name, -1)
+
+            if index != -1 and self.is_valid(bundles, name, index):
+                bundle = bundles[index]
+                if any(item.tex == image for item in bundle.pak_items):
+                    return bundle
+
+            if attempt == 0:
+                self.rebuild(bundles)
+
+        return None
+
+
+# Only one file is open at a time, so only one index is needed.
+bundle_index = BundleIndex()
+
+
+class SelectionCache():
+    """
+    The bundles selected in multi-select mode and how many images they hold, kept
+    up to date by the is_selected update so the interface doesn't have to search the
+    whole list every time it redraws.
+    """
+
+    def __init__(self):
+        # Selected bundle names and their image counts, or None if it needs rebuilding.
+        self.selected = None
+        self.image_count = 0
+
+    def invalidate(self):
+        self.selected = None
+        self.image_count = 0
+
+    def rebuild(self, bundles):
+        self.selected = {bundle.name: len(bundle.pak_items) for bundle in bundles 
+                         if bundle.is_selected}
+        self.image_count = sum(self.selected.values())
+
+    def get(self, bundles):
+        if self.selected is None:
+            self.rebuild(bundles)
+        return self.selected
+
+    def set_selected(self, bundle):
+        # Nothing to update if it's going to be rebuilt anyway.
+        if self.selected is None:
+            return
+
+        previous_count = self.selected.pop(bundle.name, 0)
+        self.image_count -= previous_count
+
+        if bundle.is_selected:
+            self.selected[bundle.name] = len(bundle.pak_items)
+            self.image_count += len(bundle.pak_items)
+
+    def get_bundles(self, bundles):
+        """
+        Returns the selected bundles in the order they appear in the list.
+        """
+
+        indexes = [bundle_index.find(bundles, name) for name in self.get(bundles)]
+
+        # A missing or unselected bundle means the list changed without the cache knowing.
+        if any(i == -1 or bundles[i].is_selected is False for i in indexes):
+            self.rebuild(bundles)
+            indexes = [bundle_index.find(bundles, name) for name in self.selected]
+
+        return [bundles[i] for i in sorted(indexes)]
+
+
+selection_cache = SelectionCache()
@@ -0,0 +1,228 @@
+# //////////////////////////////////////////////////////////////
+# //////////////////////////////////////////////////////////////
+# COMMAND LINE
+#
+# Runs exports and image packs from a background Blender, for build machines:
+#
+#   blender -b scene.blend --python-expr "import pakpal.cli; pakpal.cli.main()" -- --json summary.json export --all
+#   blender -b scene.blend --python <add-on folder>/cli.py -- --json summary.json pack --all --save
+#
+# A JSON summary is written to --json when it finishes, and Blender exits with one
+# of the exit codes below.  Blender and PakPal print other things as they run, so
+# --json is the way to read the summary.  It's also printed as the last line starting
+# with SUMMARY_PREFIX, for logs.
+#
+# This file is also imported when the add-on loads, so nothing runs unless main()
+# is called or it's used as a script.
+
+import bpy, os, sys, json, time, argparse, importlib, addon_utils
+
+EXIT_SUCCESS = 0
+EXIT_FAILED_IMAGES = 1      # Finished, but some images couldn't be exported (see IsFailedRun).
+EXIT_BAD_ARGUMENTS = 2      # The same code argparse uses.
+EXIT_NO_PAKPAL_DATA = 3     # The .blend file has no PakPal data.
+EXIT_NOTHING_TO_DO = 4      # Nothing was found to export or pack.
+EXIT_ERROR = 5              # Something went wrong part way through.
+
+SUMMARY_PREFIX = "PakPal summary: "
+
+
+def CreateArgumentParser():
+    parser = argparse.ArgumentParser(prog = "pakpal",
+                                     description = "Export or pack images with PakPal.")
+    parser.add_argument("--json", metavar = "PATH",
+                        help = "Write the JSON summary to this file.")
+    commands = parser.add_subparsers(dest = "command", required = True)
+
+    export = commands.add_parser("export", help = "Export images marked for export.")
+    export_mode = export.add_mutually_exclusive_group()
+    export_mode.add_argument("--all", dest = "set_mode", action = "store_const", const = 'ALL',
+                             help = "Export every image marked for export (default).")
+    export_mode.add_argument("--selected", dest = "set_mode", action = "store_const",
+                             const = 'SELECTED', help = "Export the selected images.")
+    export_mode.add_argument("--resume", action = "store_true",
+                             help = "Export what the last unfinished export didn't get to.")
+    export.add_argument("--locations", metavar = "NAMES", default = "",
+                        help = "Only export to these Export Locations (comma-separated names).")
+    export.add_argument("--force", action = "store_true",
+                        help = "Export images even if they haven't changed.")
+    export.add_argument("--backend", choices = ['COMPOSITOR', 'THREAD', 'PROCESS'],
+                        help = "The export backend to use.")
+    export.add_argument("--workers", type = int,
+                        help = "The number of worker threads or processes.")
+
+    pack = commands.add_parser("pack", help = "Create image packs.")
+    pack_mode = pack.add_mutually_exclusive_group()
+    pack_mode.add_argument("--all", dest = "set_mode", action = "store_const", const = 'ALL',
+                           help = "Pack every bundle (default).")
+    pack_mode.add_argument("--selected", dest = "set_mode", action = "store_const",
+                           const = 'SELECTED', help = "Pack the selected bundles.")
+    pack.add_argument("--force", action = "store_true",
+                      help = "Pack images even if their sources haven't changed.")
+    pack.add_argument("--save", action = "store_true",
+                      help = "Save the .blend file afterwards, so it keeps the packed images.")
+
+    return parser
+
+def GetScriptArguments(argv):
+    # Blender's own arguments come before the "--".
+    if "--" in argv:
+        return argv[argv.index("--") + 1:]
+    return []
+
+def GetFileData():
+    if __package__ not in bpy.context.preferences.addons:
+        addon_utils.enable(__package__, default_set = True)
+
+    addon_prefs = bpy.context.preferences.addons[__package__].preferences
+    file_data_object = bpy.data.objects.get(addon_prefs.pak_filedata_name)
+    if file_data_object is None:
+        return None
+
+    return file_data_object.PAK_FileData
+
+class TemporarySettings():
+    """
+    Changes PakPal settings for a single run, so saving afterwards doesn't keep them.
+    """
+
+    def __init__(self, file_data, settings):
+        self.file_data = file_data
+        self.settings = settings
+        self.previous = {}
+
+    def __enter__(self):
+        for name, value in self.settings.items():
+            self.previous[name] = getattr(self.file_data, name)
+            setattr(self.file_data, name, value)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for name, value in self.previous.items():
+            setattr(self.file_data, name, value)
+
+def GetUnknownLocations(file_data, location_filter):
+    """
+    Returns the names in a --locations list that don't match any Export Location.
+    """
+    location_names = set(location.name for location in file_data.locations)
+    names = [name.strip() for name in location_filter.split(",") if name.strip() != ""]
+    return [name for name in names if name not in location_names]
+
+def RunExport(file_data, arguments):
+    settings = {'force_export': arguments.force or file_data.force_export}
+    if arguments.backend is not None:
+        settings['export_backend'] = arguments.backend
+    if arguments.workers is not None:
+        settings['export_worker_count'] = arguments.workers
+
+    with TemporarySettings(file_data, settings):
+        bpy.ops.pak.export_images('EXEC_DEFAULT', set_mode = arguments.set_mode or 'ALL',
+                                  resume = arguments.resume,
+                                  location_filter = arguments.locations)
+
+def RunImagePack(file_data, arguments):
+    settings = {'force_image_pack': arguments.force or file_data.force_image_pack}
+
+    with TemporarySettings(file_data, settings):
+        bpy.ops.pak.create_image_pack('EXEC_DEFAULT', set_mode = arguments.set_mode or 'ALL')
+
+    if arguments.save:
+        bpy.ops.wm.save_mainfile()
+
+def IsFailedRun(command, results):
+    """
+    Returns True if a finished run should exit with EXIT_FAILED_IMAGES.
+    """
+    if command == "export":
+        return results.get('failed', 0) > 0
+
+    # Bundles without the slots a recipe needs are common when packing everything,
+    # so a pack only fails if none of the bundles could be packed.
+    packed = results['new_images'] + results['updated_images'] + results['unchanged']
+    return results['not_found'] > 0 and packed == 0
+
+def RunCommand(arguments):
+    """
+    Runs the command and returns it's summary.
+    """
+    from .operators import LAST_RUN_INFO
+
+    summary = {'command': arguments.command, 'blend_file': bpy.data.filepath}
+    start_time = time.perf_counter()
+
+    file_data = GetFileData()
+    if file_data is None:
+        summary['status'] = "no_pakpal_data"
+        summary['exit_code'] = EXIT_NO_PAKPAL_DATA
+        return summary
+
+    if arguments.command == "export":
+        unknown_locations = GetUnknownLocations(file_data, arguments.locations)
+        if len(unknown_locations) > 0:
+            summary['status'] = "bad_arguments"
+            summary['error'] = "No Export Location named " + ", ".join(unknown_locations)
+            summary['exit_code'] = EXIT_BAD_ARGUMENTS
+            return summary
+
+    run_key = 'export' if arguments.command == "export" else 'pack'
+    LAST_RUN_INFO.pop(run_key, None)
+
+    try:
+        if arguments.command == "export":
+            RunExport(file_data, arguments)
+        else:
+            RunImagePack(file_data, arguments)
+
+    except Exception as error:
+        summary['status'] = "error"
+        summary['error'] = str(error)
+        summary['exit_code'] = EXIT_ERROR
+        return summary
+
+    finally:
+        summary['seconds'] = round(time.perf_counter() - start_time, 3)
+
+    # The operators only record results if they found something to do.
+    results = LAST_RUN_INFO.get(run_key)
+    if results is None:
+        summary['status'] = "nothing_to_do"
+        summary['exit_code'] = EXIT_NOTHING_TO_DO
+        return summary
+
+    summary['results'] = results
+    if IsFailedRun(arguments.command, results):
+        summary['status'] = "failed_images"
+        summary['exit_code'] = EXIT_FAILED_IMAGES
+    else:
+        summary['status'] = "success"
+        summary['exit_code'] = EXIT_SUCCESS
+
+    return summary
+
+def main(argv = None):
+    """
+    Runs a PakPal command from the arguments after "--", then exits Blender.
+    """
+
+    if argv is None:
+        argv = GetScriptArguments(sys.argv)
+
+    # argparse exits with EXIT_BAD_ARGUMENTS by itself.
+    arguments = CreateArgumentParser().parse_args(argv)
+    summary = RunCommand(arguments)
+
+    if arguments.json is not None:
+        with open(arguments.json, 'w') as json_file:
+            json.dump(summary, json_file, indent = 1)
+
+    # Kept to one line so it can be found amongst everything else in the log.
+    print(SUMMARY_PREFIX + json.dumps(summary))
+
+    sys.exit(summary['exit_code'])
+
+
+if __name__ == "__main__":
+    # When run with --python, import PakPal as a package so it's relative imports work.
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.dirname(package_dir))
+    importlib.import_module(os.path.basename(package_dir) + ".cli").main()
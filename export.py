@@ -1,14 +1,29 @@
 
-import bpy, os, platform
+import bpy, os, platform, time, shutil, json, subprocess, tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from datetime import datetime
 from bpy.types import Operator, Panel, UIList
-from bpy.props import EnumProperty
+from bpy.props import EnumProperty, BoolProperty, StringProperty
 
 from .main_menu import PAK_UI_CreatePakData, PAK_UI_CreateSelectionHeader
-from .export_locations import CreateFilePath, SubstituteNameCharacters, ReplacePathTags
-from .image_format_properties import LoadImageFormat, GetImageFileExtension
-from .operators import GetSelection
+from .export_locations import ExportPathCache, SubstituteNameCharacters
+from .image_format_properties import LoadImageFormat, GetImageFileExtension, GetImageFormatKey
+from .export_manifest import ExportManifest, GetSourceStat, GetFormatHash
+from .export_journal import ExportJournal, GetJournalPath
+from .image_pack_engine import ReadImagePixels
+from .bundle_index import bundle_index
+from .image_encode import CanEncodeImage, EncodeImageFile, GetEncodeSettings, GetEncodeDtype
+from .operators import (
+    GetSelection, RecordThroughput, PAK_ModalProgress, LAST_RUN_INFO, RUNS_IN_PROGRESS
+)
+from .pipeline_scene import (
+    GetPipelineScene, 
+    SetExportNodes, 
+    RenderPipelineScene, 
+    ClearPipelineImages,
+)
 
 def FindImageContext():
     """
@@ -37,6 +52,267 @@ def FindImageContext():
     
     return override
 
+def GetExportables(file_data, set_mode):
+    """
+    Returns a list of images that should be exported for the given export mode, along
+    with the number of images that were skipped for not having an export location.
+    """
+
+    # NOTE NOTE: Make sure you don't include hidden images unless enabled.
+    exportable = []
+    selected_bundles = []
+    no_export_location = 0
+
+    # Figure out candidates
+    if set_mode == "ALL":
+        selected_bundles = [bundle for bundle in file_data.bundles]
+
+    else:
+        selected_bundles = GetSelection(file_data)
+
+    # Filter based on eligibility
+    for bundle in selected_bundles:
+
+        if (file_data.enable_bundles == True
+            and bundle.enable_export == False):
+            continue
+
+        for item in bundle.pak_items:
+            image = item.tex
+            pak_data = None
+
+            if file_data.enable_bundles == True:
+                pak_data = bundle
+            else:
+                pak_data = item.tex.PAK_Img
+                
+            if (pak_data.enable_export == False):
+                continue
+            
+            if pak_data.export_location == '0':
+                no_export_location += 1
+                continue
+
+            export_target = {}
+            export_target['image'] = image
+            export_target['bundle'] = bundle
+            export_target['export_location'] = pak_data.export_location
+            export_target['export_format'] = pak_data.export_format
+
+            exportable.append(export_target)
+    
+    return exportable, no_export_location
+
+# Formats where the saved file depends on settings PakPal can't read back from an image.
+LOSSY_FORMATS = {'JPEG', 'JPEG2000', 'WEBP'}
+
+# image.depth is the total bits of every channel, which gives the color mode and bit
+# depth of the image as export format values.
+BYTE_IMAGE_DEPTHS = {8: ('BW', '8'), 24: ('RGB', '8'), 32: ('RGBA', '8')}
+FLOAT_IMAGE_DEPTHS = {16: ('BW', '16'), 48: ('RGB', '16'), 64: ('RGBA', '16'),
+                      32: ('BW', '32'), 96: ('RGB', '32'), 128: ('RGBA', '32')}
+
+# Formats that only go up to 16 bits, which Blender reads into 32 bit float pixels.
+HALF_DEPTH_FORMATS = {'PNG', 'TIFF', 'JPEG2000'}
+
+def GetImageColorSettings(image):
+    """
+    Returns the color mode and bit depth of an image as export format values, or None
+    if they can't be told from it's depth.
+    """
+
+    if image.is_float is False:
+        return BYTE_IMAGE_DEPTHS.get(image.depth)
+
+    color_settings = FLOAT_IMAGE_DEPTHS.get(image.depth)
+    if color_settings is not None and image.file_format in HALF_DEPTH_FORMATS:
+        return (color_settings[0], '16')
+    
+    return color_settings
+
+def CanCopyImageFile(image, export_format = None):
+    """
+    Returns True if the image's file can be copied straight to the export location 
+    instead of being saved again, either because the export format is 'Original Format' 
+    (None) or because it matches the image's own format.
+    """
+    # Unsaved edits only exist in memory.
+    if image.is_dirty:
+        return False
+    
+    if image.packed_file is None:
+        if image.source != 'FILE':
+            return False
+        if not os.path.isfile(bpy.path.abspath(image.filepath, library = image.library)):
+            return False
+    
+    if export_format is None:
+        return True
+    
+    if (export_format.file_format != image.file_format 
+        or export_format.file_format in LOSSY_FORMATS):
+        return False
+    
+    return GetImageColorSettings(image) == (export_format.color_mode, export_format.color_depth)
+
+def CopyImageFile(image, file_path):
+    """
+    Writes the image's file or packed data to the file path without re-encoding it.
+    """
+    if image.packed_file is not None:
+        with open(file_path, 'wb') as image_file:
+            image_file.write(image.packed_file.data)
+        return
+
+    source_path = bpy.path.abspath(image.filepath, library = image.library)
+
+    # Exporting over the source file would leave nothing to copy.
+    if os.path.exists(file_path) and os.path.samefile(source_path, file_path):
+        return
+    
+    shutil.copyfile(source_path, file_path)
+
+def ExportImage(composite_scene, image, export_format, file_path, load_format = True):
+    """
+    Saves an image to the file path, rendering it through the pipeline scene if it 
+    has an export format.  load_format can be skipped if the scene already has the
+    export format loaded.
+    """
+
+    if export_format is not None:
+        SetExportNodes(composite_scene, image)
+
+        # This 'should' load the format associated with the image into the compositor.
+        if load_format:
+            LoadImageFormat(export_format, composite_scene.render.image_settings)
+
+        # Store the output image in it's own buffer and datablock.
+        viewer = RenderPipelineScene(composite_scene, "Export Viewer")
+
+        # use save_render to avoid the viewer node datablock from becoming a FILE type.
+        viewer.save_render(filepath = file_path, scene = composite_scene)
+
+    else:
+        image.save(filepath = file_path)
+
+# //////////////////////////////////////////////////////////////
+# //////////////////////////////////////////////////////////////
+# EXPORT WORKERS
+#
+# Large exports can be split between background Blender processes, each opening a 
+# copy of the current file and exporting a share of the images (see export_worker.py).
+
+def RunExportJob(job):
+    """
+    Exports every image in a worker job, writing the results to the job's result path.
+    Called by the worker processes.
+    """
+
+    file_data = bpy.data.objects[job['file_data_name']].PAK_FileData
+    composite_scene = GetPipelineScene(file_data)
+    composite_scene.render.image_settings.color_management = 'OVERRIDE'
+    composite_scene.view_settings.view_transform = 'Standard'
+    composite_scene.view_settings.look = 'None'
+    loaded_format_index = None
+
+    result = {'exported': [], 'failed': []}
+
+    for item in job['items']:
+        image = bpy.data.images.get(item['image'])
+        if image is None:
+            result['failed'].append([item['file_path'], "Image couldn't be found"])
+            continue
+
+        export_format = None
+        if item['format_index'] != -1:
+            export_format = file_data.formats[item['format_index']]
+        
+        try:
+            ExportImage(composite_scene, image, export_format, item['file_path'],
+                        item['format_index'] != loaded_format_index)
+            loaded_format_index = item['format_index']
+            result['exported'].append(item['file_path'])
+
+        except Exception as error:
+            result['failed'].append([item['file_path'], str(error)])
+    
+    with open(job['result_path'], 'w') as result_file:
+        json.dump(result, result_file)
+
+def RunExportWorkers(file_data_name, items, worker_count):
+    """
+    Splits the items between background Blender processes and waits for them to finish, 
+    returning the file paths that were exported and the ones that failed.  This is a
+    generator that yields while waiting, use it with 'yield from'.
+    """
+
+    results = {'exported': [], 'failed': []}
+    workers = []
+    temp_dir = tempfile.mkdtemp(prefix = "pakpal_export_", dir = bpy.app.tempdir)
+
+    try:
+        # Workers read a copy so unsaved changes to the file are included (though not
+        # unsaved image pixels, which are exported by the main process).
+        blend_path = os.path.join(temp_dir, "export.blend")
+        bpy.ops.wm.save_as_mainfile(filepath = blend_path, copy = True)
+
+        # Share out the largest images first so every worker gets a similar amount of work.
+        items = sorted(items, key = lambda item: item['pixels'], reverse = True)
+        shards = [items[i::worker_count] for i in range(worker_count)]
+        shards = [shard for shard in shards if len(shard) > 0]
+
+        worker_script = os.path.join(os.path.dirname(__file__), "export_worker.py")
+
+        for i, shard in enumerate(shards):
+            job_path = os.path.join(temp_dir, "job_" + str(i) + ".json")
+            result_path = os.path.join(temp_dir, "result_" + str(i) + ".json")
+
+            job = {'file_data_name': file_data_name, 'items': shard, 'result_path': result_path}
+            with open(job_path, 'w') as job_file:
+                json.dump(job, job_file)
+
+            process = subprocess.Popen([bpy.app.binary_path, "-b", blend_path, "-noaudio",
+                                        "--python", worker_script, "--", job_path],
+                                       stdout = subprocess.DEVNULL)
+            workers.append((process, result_path, shard))
+        
+        # Wait for the workers without blocking, so a modal export can keep the 
+        # interface running.
+        running = list(workers)
+        while len(running) > 0:
+            for worker in list(running):
+                process, result_path, shard = worker
+                return_code = process.poll()
+                if return_code is None:
+                    continue
+
+                running.remove(worker)
+                try:
+                    with open(result_path, 'r') as result_file:
+                        result = json.load(result_file)
+                except (OSError, ValueError):
+                    error = "Export worker stopped with exit code " + str(return_code)
+                    results['failed'].extend([item['file_path'], error] for item in shard)
+                    continue
+
+                results['exported'].extend(result['exported'])
+                results['failed'].extend(result['failed'])
+            
+            yield
+            if len(running) > 0:
+                time.sleep(0.01)
+    
+    finally:
+        # If the export was cancelled, the workers need stopping too.
+        for process, result_path, shard in workers:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+
+        shutil.rmtree(temp_dir, ignore_errors = True)
+    
+    return results
+
 class PAK_PT_ExportOptionsMenu(Panel):
     bl_space_type = "PROPERTIES"
     bl_region_type = "WINDOW"
@@ -89,17 +365,34 @@ class PAK_PT_ExportOptionsMenu(Panel):
         # texture_ops = layout.column(align = True)
         # texture_ops.use_property_split = True
         # texture_ops.use_property_decorate = False
+        selection_options.prop(file_data, "force_export")
+        selection_options.prop(file_data, "export_backend")
+        if file_data.export_backend != 'COMPOSITOR':
+            selection_options.prop(file_data, "export_worker_count")
+        selection_options.separator()
         selection_options.operator("pak.export_images", icon = 'EXPORT', text = 'Export All').set_mode = 'ALL'
         selection_options.operator("pak.export_images", icon = 'EXPORT', text = 'Export Selected').set_mode = 'SELECTED'
+        if os.path.exists(GetJournalPath()):
+            selection_options.operator("pak.resume_export", icon = 'RECOVER_LAST')
+        selection_options.separator()
+        plan_options = selection_options.row(align = True)
+        plan_all = plan_options.operator("pak.plan_run", icon = 'TIME', text = 'Plan All')
+        plan_all.plan_mode = 'EXPORT'
+        plan_all.set_mode = 'ALL'
+        plan_selected = plan_options.operator("pak.plan_run", icon = 'TIME', text = 'Plan Selected')
+        plan_selected.plan_mode = 'EXPORT'
+        plan_selected.set_mode = 'SELECTED'
         # selection_box_area.separator()
 
 
-class PAK_OT_Export(Operator):
+class PAK_OT_Export(PAK_ModalProgress, Operator):
     """Exports images marked for export"""
 
     bl_idname = "pak.export_images"
     bl_label = "Export"
 
+    progress_label = "PakPal Export"
+
     # This is important, pay attention :eyes:
     set_mode: EnumProperty(
         name = "Export Mode",
@@ -113,42 +406,65 @@ class PAK_OT_Export(Operator):
         options = {'HIDDEN'},
     )
 
-    # Thanks!
-    # https://blender.stackexchange.com/questions/19500/controling-compositor-by-python
-    # https://docs.blender.org/api/current/bpy.types.CompositorNode.html
-    def create_export_nodes(self):
-        
-        bpy.context.scene.use_nodes = True
-        tree = bpy.context.scene.node_tree
-        links = tree.links
-
-        # clear default nodes
-        for node in tree.nodes:
-            tree.nodes.remove(node)
+    resume: BoolProperty(
+        name = "Resume",
+        description = "Only export the images the last export didn't finish",
+        default = False,
+        options = {'HIDDEN'},
+    )
 
-        # BUILD IMAGE NODE
-        input_node = tree.nodes.new(type = 'CompositorNodeImage')
-        input_node.image = self.source_image
-        input_node.location = 0,0
+    location_filter: StringProperty(
+        name = "Location Filter",
+        description = "A comma-separated list of Export Location names.  If set, only images exported to these locations are exported",
+        default = "",
+        options = {'HIDDEN'},
+    )
 
-        # BUILD OUTPUT
-        output_node = tree.nodes.new(type = 'CompositorNodeViewer')
-        output_node.location = 300,0
+    def finish_pending_export(self, pending_export, journal, report_info):
+        """
+        Waits for an image being encoded on a worker thread and records it.
+        """
 
-        links.new(input_node.outputs[0], output_node.inputs[0])
+        job, image_name, pixel_count, manifest_entry = pending_export
+        manifest, filename, file_path, source_hash, source_stat, format_hash = manifest_entry
 
-        
+        try:
+            job.result()
+        except OSError as error:
+            print("PakPal couldn't export " + file_path + " - " + str(error))
+            report_info['failed'] += 1
+            return
 
-    def execute(self, context):
+        manifest.update(filename, file_path, source_hash, source_stat, format_hash)
+        journal.mark_done(image_name)
+        report_info['exported_images'] += 1
+        report_info['exported_pixels'] += pixel_count
+        self.progress_done += 1
+        self.progress_bytes += pixel_count * 4
+
+    def run(self, context):
+        """
+        Exports every image, yielding after each one (see PAK_ModalProgress).
+        """
         
         try:
             addon_prefs = context.preferences.addons[__package__].preferences
             file_data = bpy.data.objects[addon_prefs.pak_filedata_name].PAK_FileData
         except:
-            return {'CANCELLED'}
+            return
 
-        report_info = {'exported_images': 0, 'no_export_location': 0}
-        export_time = datetime.now()
+        report_info = {'exported_images': 0, 'no_export_location': 0, 'copied_images': 0,
+                       'unchanged': 0, 'failed': 0, 'exported_pixels': 0, 'export_seconds': 0.0}
+        manifests = {}
+        worker_items = []
+        export_paths = ExportPathCache(file_data, datetime.now())
+        use_workers = file_data.export_backend == 'PROCESS' and file_data.export_worker_count > 1
+
+        # Images read on the main thread can be encoded and saved on a thread pool.
+        export_pool = None
+        pending_exports = deque()
+        if file_data.export_backend == 'THREAD':
+            export_pool = ThreadPoolExecutor(max_workers = file_data.export_worker_count)
         
 
         # /////////////////////////////////////////////////////////////////
@@ -156,132 +472,226 @@ class PAK_OT_Export(Operator):
         # Because of bundles we have to separate the export options from the PAK
         # image data.
 
-        # NOTE NOTE: Make sure you don't include hidden images unless enabled.
-        exportable = []
-        selected_bundles = []
+        # A resumed export uses the same images as the one it's resuming, minus the
+        # ones it finished.
+        journal = ExportJournal(GetJournalPath())
+        set_mode = self.set_mode
+        if self.resume:
+            if journal.load() is False or len(journal.get_remaining()) == 0:
+                self.report({'WARNING'}, "There's no unfinished export to resume.")
+                return
+            set_mode = journal.set_mode
+
+        exportable, report_info['no_export_location'] = GetExportables(file_data, set_mode)
+        if self.resume:
+            remaining = set(journal.get_remaining())
+            exportable = [e for e in exportable if e['image'].name in remaining]
+
+        if self.location_filter != "":
+            location_names = set(name.strip() for name in self.location_filter.split(","))
+            exportable = [e for e in exportable 
+                          if file_data.locations[int(e['export_location']) - 1].name in location_names]
 
-        # Figure out candidates
-        if self.set_mode == "ALL":
-            selected_bundles = [bundle for bundle in file_data.bundles]
+        if len(exportable) == 0:
+            self.report({'WARNING'}, "No exportable images found.  Make sure all images marked for export have a valid Export Location.")
+            return
+        
+        self.progress_total = len(exportable)
 
+        if self.resume:
+            journal.resume()
         else:
-            selected_bundles = GetSelection(file_data)
-
-        # Filter based on eligibility
-        for bundle in selected_bundles:
-
-            if (file_data.enable_bundles == True
-                and bundle.enable_export == False):
-                continue
+            journal.begin(set_mode, [e['image'].name for e in exportable])
 
-            for item in bundle.pak_items:
-                image = item.tex
-                pak_data = None
-
-                if file_data.enable_bundles == True:
-                    pak_data = bundle
-                else:
-                    pak_data = item.tex.PAK_Img
-                    
-                if (pak_data.enable_export == False):
-                    continue
-                
-                if pak_data.export_location == '0':
-                    report_info['no_export_location'] += 1
-                    continue
-
-                export_target = {}
-                export_target['image'] = image
-                export_target['export_location'] = pak_data.export_location
-                export_target['export_format'] = pak_data.export_format
-
-                exportable.append(export_target)
-
-
-        print(selected_bundles)
-        print(exportable)
-
-        if len(exportable) == 0:
-            self.report({'WARNING'}, "No exportable images found.  Make sure all images marked for export have a valid Export Location.")
-            return {'FINISHED'}
+        # The image list can change between steps, so images and bundles are found
+        # again by name each time instead of being held onto.
+        for export_item in exportable:
+            export_item['image'] = export_item['image'].name
+            export_item['bundle'] = export_item['bundle'].name
         
         # /////////////////////////////////////////////////////////////////
-        # BUILD SCENE AND COMPOSITOR
-        
-        # NOTE - The context won't actually change unless we escape the properties context.
-        # Properties > Output has it's own scene context!
-        # TODO: Potentially find a way to change the scene context for just the properties panel.
-        old_type = context.area.type
-        context.area.type = 'VIEW_3D'
-        bpy.ops.scene.new(type = 'NEW')
-        composite_scene = bpy.context.scene
-
+        # FIND SCENE AND COMPOSITOR
+        # The export graph is kept in the pipeline scene, so only the image needs changing.
+        composite_scene = GetPipelineScene(file_data)
 
         # TODO: Add custom color management settings
         # These will prevent color alteration.
         composite_scene.render.image_settings.color_management = 'OVERRIDE'
         composite_scene.view_settings.view_transform = 'Standard'
         composite_scene.view_settings.look = 'None'
+        loaded_format_index = None
 
         
         # /////////////////////////////////////////////////////////////////
         # ITERATE AND EXPORT TARGETS
 
-        for export_item in exportable:
-            image = export_item['image']
-
-            location_index = int(export_item['export_location']) - 1
-            location = file_data.locations[location_index]
+        # The export can be cancelled at any yield, so anything that's finished still
+        # needs recording.
+        try:
+            for export_item in exportable:
+                yield
+                image = bpy.data.images.get(export_item['image'])
+                bundle = bundle_index.get_bundle(file_data.bundles, export_item['bundle'])
+                if image is None or bundle is None:
+                    print("PakPal couldn't export " + export_item['image'] 
+                          + " - it was removed during the export.")
+                    report_info['failed'] += 1
+                    self.progress_done += 1
+                    continue
 
-            format_index = int(export_item['export_format']) - 1
-            self.source_image = image
+                location_index = int(export_item['export_location']) - 1
+                format_index = int(export_item['export_format']) - 1
 
-            # TODO: Add file tag support
-            # path = ReplacePathTags(location.path, True, bundle, export_time)
-            path = CreateFilePath(location.path)
-            filename = SubstituteNameCharacters(image.name)
-            filename = filename.rsplit( ".", 1 )[ 0 ]
+                path = export_paths.get_path(location_index, bundle)
+                filename = SubstituteNameCharacters(image.name)
+                filename = filename.rsplit( ".", 1 )[ 0 ]
 
-            if format_index != -1:
-                format = file_data.formats[format_index]
-                file_ext = GetImageFileExtension(format.file_format)
+                export_format = None
+                if format_index != -1:
+                    export_format = file_data.formats[format_index]
+                    file_ext = GetImageFileExtension(export_format.file_format)
+                    format_hash = GetFormatHash(GetImageFormatKey(export_format))
+                else:
+                    file_ext = GetImageFileExtension(image.file_format)
+                    format_hash = GetFormatHash(('ORIGINAL', image.file_format))
                 filename = filename + file_ext
 
-                # TODO: Provide the right image to the right node instead of doing this every export.
-                self.create_export_nodes()
+                # Skip images that haven't changed since they were last exported here.
+                if path not in manifests:
+                    manifests[path] = ExportManifest(path)
+                manifest = manifests[path]
 
-                # This 'should' load the format associated with the image into the compositor.
-                LoadImageFormat(format, composite_scene.render.image_settings)
+                source_stat = GetSourceStat(image)
+                source_hash = manifest.get_source_hash(filename, image, source_stat)
 
-                # This renders whatever is on the compositor.
-                # When using a File Output node it will forcefully add a frame number
-                # to the end, so we do this instead.
-                bpy.ops.render.render(animation=False, write_still=False, 
-                                    use_viewport=False, layer="", scene="")
-                
-                # Store the output image in it's own buffer and datablock.
-                viewer = bpy.data.images['Viewer Node']
+                if (file_data.force_export is False 
+                    and manifest.is_unchanged(filename, path + filename, source_hash, format_hash)):
+                    journal.mark_done(image.name)
+                    report_info['unchanged'] += 1
+                    self.progress_done += 1
+                    continue
 
-                # use save_render to avoid the viewer node datablock from becoming a FILE type.
-                viewer.save_render(filepath = path + filename)
+                # Untouched images that are already in the right format can just be copied.
+                if CanCopyImageFile(image, export_format):
+                    CopyImageFile(image, path + filename)
+                    manifest.update(filename, path + filename, source_hash, source_stat, format_hash)
+                    journal.mark_done(image.name)
+                    report_info['copied_images'] += 1
+                    report_info['exported_images'] += 1
+                    self.progress_done += 1
+                    continue
 
+                # Workers open a saved copy of the file, which only has the pixels that
+                # are on disk or packed.  Anything else has to be exported from here.
+                in_saved_copy = (image.is_dirty is False 
+                                 and (image.packed_file is not None or image.source == 'FILE'))
+
+                if use_workers and in_saved_copy:
+                    worker_items.append({
+                        'image': image.name,
+                        'format_index': format_index,
+                        'file_path': path + filename,
+                        'pixels': image.size[0] * image.size[1],
+                        'manifest': (manifest, filename, source_hash, source_stat, format_hash),
+                    })
+                    continue
 
-            else:
-                file_ext = GetImageFileExtension(image.file_format)
-                filename = filename + file_ext
-                image.save(filepath = path + filename)
+                item_start_time = time.perf_counter()
+
+                if (export_pool is not None and export_format is not None 
+                    and CanEncodeImage(export_format.file_format)):
+                    encode_settings = GetEncodeSettings(export_format)
+                    pixels = ReadImagePixels(image, GetEncodeDtype(encode_settings))
+                    job = export_pool.submit(EncodeImageFile, pixels, encode_settings, path + filename)
+
+                    manifest_entry = (manifest, filename, path + filename, 
+                                      source_hash, source_stat, format_hash)
+                    pending_exports.append((job, image.name, image.size[0] * image.size[1], 
+                                            manifest_entry))
+
+                    # Don't let too many images waiting to be encoded pile up in memory.
+                    while len(pending_exports) > file_data.export_worker_count * 2:
+                        self.finish_pending_export(pending_exports.popleft(), journal, report_info)
+                
+                    report_info['export_seconds'] += time.perf_counter() - item_start_time
+                    continue
+
+                # Images sharing a format don't need it loaded again.
+                ExportImage(composite_scene, image, export_format, path + filename,
+                            format_index != loaded_format_index)
+                loaded_format_index = format_index
+            
+                manifest.update(filename, path + filename, source_hash, source_stat, format_hash)
+                journal.mark_done(image.name)
+                report_info['exported_images'] += 1
+                report_info['exported_pixels'] += image.size[0] * image.size[1]
+                report_info['export_seconds'] += time.perf_counter() - item_start_time
+                self.progress_done += 1
+                self.progress_bytes += image.size[0] * image.size[1] * 4
             
-            report_info['exported_images'] += 1
+            # /////////////////////////////////////////////////////////////////
+            # EXPORT WITH WORKERS
+
+            if export_pool is not None:
+                drain_start_time = time.perf_counter()
+                while len(pending_exports) > 0:
+                    self.finish_pending_export(pending_exports.popleft(), journal, report_info)
+                    yield
+
+                report_info['export_seconds'] += time.perf_counter() - drain_start_time
+
+            if len(worker_items) > 0:
+                worker_start_time = time.perf_counter()
+                job_items = [{k: v for k, v in item.items() if k != 'manifest'} for item in worker_items]
+                results = yield from RunExportWorkers(addon_prefs.pak_filedata_name, job_items, 
+                                                      file_data.export_worker_count)
             
+                exported = set(results['exported'])
+                for item in worker_items:
+                    if item['file_path'] not in exported:
+                        continue
+
+                    manifest, filename, source_hash, source_stat, format_hash = item['manifest']
+                    manifest.update(filename, item['file_path'], source_hash, source_stat, format_hash)
+                    journal.mark_done(item['image'])
+                    report_info['exported_images'] += 1
+                    report_info['exported_pixels'] += item['pixels']
+                    self.progress_done += 1
+                    self.progress_bytes += item['pixels'] * 4
+            
+                # Workers run at the same time, so only the total time is useful.
+                report_info['export_seconds'] += time.perf_counter() - worker_start_time
+                report_info['failed'] += len(results['failed'])
+
+                for file_path, error in results['failed']:
+                    print("PakPal couldn't export " + file_path + " - " + error)
+
+        finally:
+            if export_pool is not None:
+                export_pool.shutdown(cancel_futures = True)
+
+            # Don't keep the last exported image alive through the pipeline scene.
+            ClearPipelineImages(composite_scene)
+
+            for manifest in manifests.values():
+                manifest.save()
+
+            # Kept if anything is left to export, so the export can be resumed.
+            journal.close()
+
         # TODO: Fully test info statements
 
-        # ///////////////////////////////////////////////////////////////////////////
-        # RESTORE SCENE
-        # Delete the composite scene and change the area context back.
-        bpy.data.scenes.remove(composite_scene, do_unlink = True)
-        context.area.type = old_type
+        # Used to estimate how long future exports will take.  Copies are left out, as
+        # they don't depend on the size of the image.
+        RecordThroughput(file_data, "export_seconds_per_megapixel", 
+                         report_info['export_seconds'], report_info['exported_pixels'])
+        LAST_RUN_INFO['export'] = dict(report_info)
         
-        if report_info['exported_images'] == 0:
+        if report_info['exported_images'] == 0 and report_info['unchanged'] > 0:
+            info = "All " + str(report_info['unchanged']) + " images were unchanged since they were last exported."
+            self.report({'INFO'}, info)
+
+        elif report_info['exported_images'] == 0:
             info = "PakPal exported no images."
             self.report({'WARNING'}, info)
 
@@ -302,9 +712,34 @@ class PAK_OT_Export(Operator):
                     info += ' images '
                 
                 info += 'have no Export Location set.'
+
+            if report_info['unchanged'] > 0:
+                info += "  " + str(report_info['unchanged']) + " were unchanged and skipped."
+
+            if report_info['copied_images'] > 0:
+                info += "  " + str(report_info['copied_images']) + " were copied without being saved again."
+
+            if report_info['failed'] > 0:
+                info += "  " + str(report_info['failed']) + " failed to export (see the console for details)."
             
             self.report({'INFO'}, info)
-        
 
-        return {'FINISHED'}
 
+class PAK_OT_ResumeExport(Operator):
+    """Exports the images the last export didn't get to, if it was cancelled or Blender closed before it finished"""
+
+    bl_idname = "pak.resume_export"
+    bl_label = "Resume Last Export"
+
+    @classmethod
+    def poll(cls, context):
+        return len(RUNS_IN_PROGRESS) == 0 and os.path.exists(GetJournalPath())
+
+    def execute(self, context):
+        result = bpy.ops.pak.export_images('EXEC_DEFAULT', resume = True)
+        return {'CANCELLED'} if 'CANCELLED' in result else {'FINISHED'}
+
+    def invoke(self, context, event):
+        # The export runs it's own modal handler, so this is finished once it's started.
+        result = bpy.ops.pak.export_images('INVOKE_DEFAULT', resume = True)
+        return {'CANCELLED'} if 'CANCELLED' in result else {'FINISHED'}
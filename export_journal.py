@@ -0,0 +1,131 @@
+import bpy, os, json, tempfile
+
+# //////////////////////////////////////////////////////////////
+# //////////////////////////////////////////////////////////////
+# EXPORT JOURNAL
+#
+# Every export writes a journal next to the .blend file, starting with the images
+# it plans to export and then a line for every image that's been finished.  Each
+# line is flushed to disk as it's written, so if Blender crashes part way through
+# an export it can be resumed without exporting the finished images again.
+#
+# Once every planned image has been exported the journal is removed.
+
+JOURNAL_VERSION = 1
+
+
+def GetJournalPath():
+    """
+    Returns the path of the export journal for the current .blend file.
+    """
+
+    # Unsaved files still need somewhere that survives a crash.
+    if bpy.data.filepath == "":
+        return os.path.join(tempfile.gettempdir(), "untitled.pakpal_journal")
+
+    return os.path.splitext(bpy.data.filepath)[0] + ".pakpal_journal"
+
+
+class ExportJournal():
+    """
+    The journal for the export currently running, or the last one that didn't finish.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.set_mode = 'ALL'
+        self.planned = []
+        self.done = set()
+        self.journal_file = None
+
+    def load(self):
+        """
+        Reads an existing journal, returning False if there isn't a usable one.
+        """
+        try:
+            with open(self.file_path, 'r') as journal_file:
+                lines = journal_file.readlines()
+        except OSError:
+            return False
+
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, ValueError):
+            return False
+
+        if isinstance(header, dict) is False or header.get('version') != JOURNAL_VERSION:
+            return False
+
+        self.set_mode = header['set_mode']
+        self.planned = header['planned']
+
+        # If Blender crashed while a line was being written the last line could be
+        # cut off, which just means that image gets exported again.
+        for line in lines[1:]:
+            try:
+                self.done.add(json.loads(line)['done'])
+            except (ValueError, KeyError, TypeError):
+                continue
+
+        return True
+
+    def begin(self, set_mode, planned):
+        """
+        Starts a new journal for the given images, replacing the last one.
+        """
+        self.set_mode = set_mode
+        self.planned = list(planned)
+        self.done = set()
+
+        header = {'version': JOURNAL_VERSION, 'set_mode': set_mode, 'planned': self.planned}
+        self.open_journal('w')
+        self.write_line(header)
+
+    def resume(self):
+        """
+        Opens a loaded journal so more images can be marked as done.
+        """
+        self.open_journal('a')
+
+        # Start on a new line in case the last one was cut off.
+        if self.journal_file is not None:
+            self.journal_file.write("\n")
+
+    def open_journal(self, mode):
+        # A journal that can't be written shouldn't stop the export.
+        try:
+            self.journal_file = open(self.file_path, mode)
+        except OSError as error:
+            print("PakPal couldn't write the export journal - " + str(error))
+
+    def write_line(self, entry):
+        if self.journal_file is None:
+            return
+
+        self.journal_file.write(json.dumps(entry) + "\n")
+        self.journal_file.flush()
+        os.fsync(self.journal_file.fileno())
+
+    def mark_done(self, image_name):
+        if image_name in self.done:
+            return
+
+        self.done.add(image_name)
+        self.write_line({'done': image_name})
+
+    def get_remaining(self):
+        return [name for name in self.planned if name not in self.done]
+
+    def close(self):
+        """
+        Closes the journal, removing it if every planned image was exported.
+        """
+        if self.journal_file is not None:
+            self.journal_file.close()
+            self.journal_file = None
+
+        if len(self.get_remaining()) == 0:
+            try:
+                os.remove(self.file_path)
+            except OSError:
+                pass
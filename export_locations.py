@@ -1,5 +1,5 @@
 
-import bpy, os, platform
+import bpy, os, platform, re
 
 from bpy.types import Menu, Panel, Operator, UIList
 from bpy.props import EnumProperty
@@ -168,7 +168,7 @@ class PAK_PT_Location(Panel):
             
 
 
-def CreateFilePath(file_path, replace_invalid_chars = True):
+def CreateFilePath(file_path, replace_invalid_chars = True, create_directory = True):
     """
     Extracts and calculates a final path with which to export the target to.
     """
@@ -206,7 +206,7 @@ def CreateFilePath(file_path, replace_invalid_chars = True):
         file_path = drive_indicator + "\\" + file_path
     
     # Build the file path
-    if not os.path.exists(file_path):
+    if create_directory is True and not os.path.exists(file_path):
         os.makedirs(file_path)
     
     return file_path
@@ -253,60 +253,121 @@ def SubstitutePathCharacters(path):
 
   return result
 
-def ReplacePathTags(file_path, replace_invalid_chars, bundle, export_time):
+# Matches the ^tag^ markers added by PAK_OT_AddExportLocTag.
+PATH_TAG_PATTERN = re.compile(r"\^(\w+)\^")
+
+# How each date and time tag is written.
+PATH_TIME_FORMATS = {
+    'export_date_ymd': '%Y-%m-%d',
+    'export_date_dmy': '%d-%m-%Y',
+    'export_date_mdy': '%m-%d-%Y',
+    'export_time_hm': '%H.%M',
+    'export_time_hms': '%H.%M.%S',
+}
+
+def GetRunPathTags(replace_invalid_chars, export_time):
     """
-    Searches for and substitutes the tags in a path name.  USE THIS AFTER CreateFilePath().
+    Returns the value of every tag that stays the same for a whole export.
     """
 
+    blend_name = bpy.path.basename(bpy.context.blend_data.filepath)
+    blend_name = blend_name.replace(".blend", "")
 
-    if file_path.find('^bundle_name^'):
+    if replace_invalid_chars is True:
+        blend_name = SubstituteNameCharacters(blend_name)
 
-        bundle_name = ""
-        if len(bundle.pak_items) > 0:
-            bundle_name = bundle.name
+    tags = {'blend_file_name': blend_name}
+    for tag, time_format in PATH_TIME_FORMATS.items():
+        tags[tag] = export_time.strftime(time_format)
 
-        if replace_invalid_chars is True:
-            bundle_name = SubstituteNameCharacters(bundle_name)
+    return tags
 
-        file_path = file_path.replace('^bundle_name^', bundle_name)
+def GetBundlePathTag(replace_invalid_chars, bundle):
+    bundle_name = ""
+    if len(bundle.pak_items) > 0:
+        bundle_name = bundle.name
 
-    
-    if file_path.find('^blend_file_name^'):
+    if replace_invalid_chars is True:
+        bundle_name = SubstituteNameCharacters(bundle_name)
 
-        blend_name = bpy.path.basename(bpy.context.blend_data.filepath)
-        blend_name = blend_name.replace(".blend", "")
+    return bundle_name
 
-        if replace_invalid_chars is True:
-            blend_name = SubstituteNameCharacters(blend_name)
 
-        file_path = file_path.replace('^blend_file_name^', blend_name)
-    
-    
-    # DATE AND TIME
+class PathTemplate():
+    """
+    A location path split into text and tags, so it only needs searching once.
+    """
 
-    if file_path.find('export_date_ymd'):
-        
-        time = export_time.strftime('%Y-%m-%d')
-        file_path = file_path.replace('^export_date_ymd^', time)
+    def __init__(self, file_path):
+        self.parts = []
+        self.tags = set()
 
-    if file_path.find('export_date_dmy'):
+        last_end = 0
+        for match in PATH_TAG_PATTERN.finditer(file_path):
+            self.parts.append((False, file_path[last_end:match.start()]))
+            self.parts.append((True, match.group(1)))
+            self.tags.add(match.group(1))
+            last_end = match.end()
 
-        time = export_time.strftime('%d-%m-%Y')
-        file_path = file_path.replace('^export_date_dmy^', time)
+        self.parts.append((False, file_path[last_end:]))
+        self.uses_bundle = 'bundle_name' in self.tags
 
-    if file_path.find('export_date_mdy'):
+    def expand(self, tag_values):
+        # Anything that isn't a tag PakPal knows about is left as it was.
+        result = []
+        for is_tag, text in self.parts:
+            if is_tag is False:
+                result.append(text)
+            elif text in tag_values:
+                result.append(tag_values[text])
+            else:
+                result.append("^" + text + "^")
 
-        time = export_time.strftime('%m-%d-%Y')
-        file_path = file_path.replace('^export_date_mdy^', time)
-    
-    if file_path.find('export_time_hm'):
+        return "".join(result)
 
-        time = export_time.strftime('%H.%M')
-        file_path = file_path.replace('^export_time_hm^', time)
 
-    if file_path.find('export_time_hms'):
+def ReplacePathTags(file_path, replace_invalid_chars, bundle, export_time):
+    """
+    Searches for and substitutes the tags in a path name.  USE THIS BEFORE CreateFilePath(),
+    otherwise the folders will be made with the tags still in them.
+    """
 
-        time = export_time.strftime('%H.%M.%S')
-        file_path = file_path.replace('^export_time_hms^', time)
-    
-    return file_path    
\ No newline at end of file
+    template = PathTemplate(file_path)
+    tag_values = GetRunPathTags(replace_invalid_chars, export_time)
+    if template.uses_bundle:
+        tag_values['bundle_name'] = GetBundlePathTag(replace_invalid_chars, bundle)
+
+    return template.expand(tag_values)
+
+
+class ExportPathCache():
+    """
+    Resolves the folders for every export location once per export, rather than once
+    per image.  Each folder is only checked and created the first time it's used.
+    """
+
+    def __init__(self, file_data, export_time, create_directories = True):
+        self.templates = [PathTemplate(location.path) for location in file_data.locations]
+        self.run_tags = GetRunPathTags(True, export_time)
+        self.create_directories = create_directories
+        self.paths = {}
+
+    def get_path(self, location_index, bundle):
+        template = self.templates[location_index]
+
+        # Only the bundle name tag changes between images in the same export.
+        path_key = (location_index, None)
+        if template.uses_bundle:
+            path_key = (location_index, bundle.name)
+
+        path = self.paths.get(path_key)
+        if path is None:
+            tag_values = self.run_tags
+            if template.uses_bundle:
+                tag_values = dict(self.run_tags, bundle_name = GetBundlePathTag(True, bundle))
+
+            path = CreateFilePath(template.expand(tag_values), 
+                                  create_directory = self.create_directories)
+            self.paths[path_key] = path
+
+        return path
@@ -0,0 +1,131 @@
+import bpy, os, json, hashlib
+import numpy as np
+
+# //////////////////////////////////////////////////////////////
+# //////////////////////////////////////////////////////////////
+# EXPORT MANIFESTS
+#
+# Every export location keeps a manifest of the images PakPal exported to it,
+# so images that haven't changed since the last export can be skipped.
+#
+# Each entry stores a hash of the source image's contents, the format used to save
+# it and the size and modification time of the exported file.  If anything about
+# the source, format or exported file changes the image is exported again.
+
+MANIFEST_FILE_NAME = ".pakpal_manifest.json"
+MANIFEST_VERSION = 1
+
+# How much of a file is hashed at once.
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def GetFileHash(file_path):
+    file_hash = hashlib.sha1()
+    with open(file_path, 'rb') as hash_file:
+        for chunk in iter(lambda: hash_file.read(HASH_CHUNK_SIZE), b""):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+def GetPixelHash(image):
+    pixels = np.empty(image.size[0] * image.size[1] * image.channels, dtype = np.float32)
+    image.pixels.foreach_get(pixels)
+    return hashlib.sha1(pixels.tobytes()).hexdigest()
+
+def GetSourceStat(image):
+    """
+    Returns the path, modification time and size of the file an image was loaded from,
+    or None if the image doesn't match a file on disk.
+    """
+    if image.is_dirty or image.packed_file is not None or image.source != 'FILE':
+        return None
+
+    source_path = bpy.path.abspath(image.filepath, library = image.library)
+    try:
+        file_stat = os.stat(source_path)
+    except OSError:
+        return None
+
+    return [source_path, file_stat.st_mtime_ns, file_stat.st_size]
+
+def GetOutputStat(file_path):
+    try:
+        file_stat = os.stat(file_path)
+    except OSError:
+        return None
+
+    return [file_stat.st_mtime_ns, file_stat.st_size]
+
+def GetFormatHash(format_key):
+    return hashlib.sha1(repr(format_key).encode()).hexdigest()
+
+
+class ExportManifest():
+    """
+    The manifest for a single export location.
+    """
+
+    def __init__(self, directory):
+        self.file_path = os.path.join(directory, MANIFEST_FILE_NAME)
+        self.entries = {}
+        self.is_changed = False
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.file_path, 'r') as manifest_file:
+                manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            return
+
+        # Old or broken manifests just mean everything gets exported again.
+        if isinstance(manifest, dict) and manifest.get('version') == MANIFEST_VERSION:
+            self.entries = manifest.get('entries', {})
+
+    def save(self):
+        if self.is_changed is False:
+            return
+
+        manifest = {'version': MANIFEST_VERSION, 'entries': self.entries}
+
+        # Write to a temporary file first so an interrupted save can't break the manifest.
+        temp_path = self.file_path + ".tmp"
+        with open(temp_path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent = 1)
+        os.replace(temp_path, self.file_path)
+        self.is_changed = False
+
+    def get_source_hash(self, file_name, image, source_stat):
+        """
+        Returns a hash of the image's contents.  Files are only hashed again if they've
+        changed since the last export.
+        """
+        entry = self.entries.get(file_name)
+        if source_stat is not None and entry is not None and entry['source_stat'] == source_stat:
+            return entry['source_hash']
+
+        if source_stat is not None:
+            return GetFileHash(source_stat[0])
+
+        if image.packed_file is not None and image.is_dirty is False:
+            return hashlib.sha1(image.packed_file.data).hexdigest()
+
+        return GetPixelHash(image)
+
+    def is_unchanged(self, file_name, output_path, source_hash, format_hash):
+        entry = self.entries.get(file_name)
+        if entry is None:
+            return False
+
+        return (entry['source_hash'] == source_hash
+                and entry['format_hash'] == format_hash
+                and entry['output_stat'] == GetOutputStat(output_path))
+
+    def update(self, file_name, output_path, source_hash, source_stat, format_hash):
+        self.entries[file_name] = {
+            'source_hash': source_hash,
+            'source_stat': source_stat,
+            'format_hash': format_hash,
+            'output_stat': GetOutputStat(output_path),
+        }
+        self.is_changed = True
@@ -0,0 +1,32 @@
+# //////////////////////////////////////////////////////////////
+# //////////////////////////////////////////////////////////////
+# EXPORT WORKER
+#
+# Run by background Blender processes started from RunExportWorkers():
+#
+#   blender -b <copy of the file> --python export_worker.py -- <job file>
+#
+# This file is also imported when the add-on loads, so nothing runs unless it's
+# used as a script.
+
+import bpy, os, sys, json, importlib
+
+def main():
+    job_path = sys.argv[sys.argv.index("--") + 1]
+    with open(job_path, 'r') as job_file:
+        job = json.load(job_file)
+
+    # Import PakPal as a package so it's relative imports work.
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.dirname(package_dir))
+    package = importlib.import_module(os.path.basename(package_dir))
+
+    # The add-on might not be enabled in this process.
+    if hasattr(bpy.types.Object, "PAK_FileData") is False:
+        package.register()
+
+    export = importlib.import_module(package.__name__ + ".export")
+    export.RunExportJob(job)
+
+if __name__ == "__main__":
+    main()
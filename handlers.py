@@ -0,0 +1,110 @@
+import bpy
+from bpy.app.handlers import persistent
+
+from .operators import RefreshBundles, RUNS_IN_PROGRESS
+from .material_slots import ForgetSlotMatches
+from .bundle_index import selection_cache
+
+# //////////////////////////////////////////////////////////////
+# //////////////////////////////////////////////////////////////
+# IMAGE LIST HANDLERS
+#
+# Keeps the image list up to date as images are added, renamed and removed, so it
+# doesn't need refreshing by hand.  Depsgraph updates happen constantly, so the
+# handler only checks if anything happened to images and leaves the actual refresh
+# to a timer, which also merges lots of changes in a row into a single refresh.
+
+# How long to wait before trying again while an export or pack is running.
+REFRESH_RETRY_INTERVAL = 0.5
+
+# The image names from the last refresh, to tell if the list needs updating.
+last_image_names = []
+
+# Set when a setting changed that needs a refresh even if the images haven't.
+refresh_forced = False
+
+
+def GetFileData():
+    try:
+        addon_prefs = bpy.context.preferences.addons[__package__].preferences
+        return addon_prefs, bpy.data.objects[addon_prefs.pak_filedata_name].PAK_FileData
+    except KeyError:
+        return None, None
+
+def PAK_Timer_RefreshBundles():
+    global last_image_names, refresh_forced
+
+    if len(RUNS_IN_PROGRESS) > 0:
+        return REFRESH_RETRY_INTERVAL
+
+    # Images being edited (like texture painting) also count as updates, so make
+    # sure something was added, renamed or removed before checking every bundle.
+    image_names = bpy.data.images.keys()
+    if image_names == last_image_names and refresh_forced is False:
+        return None
+
+    refresh_forced = False
+
+    # Renamed and removed images won't be matched by their old names again.
+    ForgetSlotMatches(set(last_image_names).difference(image_names))
+    last_image_names = image_names
+    
+    addon_prefs, file_data = GetFileData()
+    if file_data is None:
+        return None
+
+    RefreshBundles(addon_prefs, file_data)
+    return None
+
+def RequestBundleRefresh(force = False):
+    global refresh_forced
+
+    if force:
+        refresh_forced = True
+
+    if bpy.app.timers.is_registered(PAK_Timer_RefreshBundles) is False:
+        bpy.app.timers.register(PAK_Timer_RefreshBundles, first_interval = 0)
+
+@persistent
+def PAK_Handler_DepsgraphUpdate(scene, depsgraph):
+    if (depsgraph.id_type_updated('IMAGE') 
+        or len(bpy.data.images) != len(last_image_names)):
+        RequestBundleRefresh()
+
+@persistent
+def PAK_Handler_LoadPost(*args):
+    global last_image_names
+
+    # The list saved with the file could be out of date if images were changed
+    # without PakPal running.
+    last_image_names = []
+    selection_cache.invalidate()
+
+    # Runs are cancelled when a file is loaded, but just in case one didn't clean up
+    # it shouldn't stop the new file's list from ever refreshing.
+    RUNS_IN_PROGRESS.clear()
+    RequestBundleRefresh()
+
+@persistent
+def PAK_Handler_UndoRedo(*args):
+    # Undo can change the selection without any update callbacks.
+    selection_cache.invalidate()
+
+
+def register():
+    bpy.app.handlers.depsgraph_update_post.append(PAK_Handler_DepsgraphUpdate)
+    bpy.app.handlers.load_post.append(PAK_Handler_LoadPost)
+    bpy.app.handlers.undo_post.append(PAK_Handler_UndoRedo)
+    bpy.app.handlers.redo_post.append(PAK_Handler_UndoRedo)
+
+def unregister():
+    if PAK_Handler_DepsgraphUpdate in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(PAK_Handler_DepsgraphUpdate)
+    if PAK_Handler_LoadPost in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(PAK_Handler_LoadPost)
+    if PAK_Handler_UndoRedo in bpy.app.handlers.undo_post:
+        bpy.app.handlers.undo_post.remove(PAK_Handler_UndoRedo)
+    if PAK_Handler_UndoRedo in bpy.app.handlers.redo_post:
+        bpy.app.handlers.redo_post.remove(PAK_Handler_UndoRedo)
+    if bpy.app.timers.is_registered(PAK_Timer_RefreshBundles):
+        bpy.app.timers.unregister(PAK_Timer_RefreshBundles)
@@ -0,0 +1,226 @@
+import struct, zlib
+import numpy as np
+
+# //////////////////////////////////////////////////////////////
+# //////////////////////////////////////////////////////////////
+# IMAGE ENCODING
+#
+# Encodes pixel arrays straight into image file bytes, so packed images can
+# be stored in the .blend file (and optionally saved) without Blender needing
+# to save and reload them from disk first.
+#
+# Pixel arrays are shaped (height, width, 4) and use Blender's bottom-up
+# row order.  Only simple formats are supported, everything else still has
+# to be saved by Blender.
+
+# Luminance weights used when writing BW images (Rec. 709, same as Blender's default config).
+LUMINANCE_WEIGHTS = np.array([0.2126, 0.7152, 0.0722], dtype = np.float32)
+
+ENCODABLE_FORMATS = {'PNG', 'BMP', 'TARGA_RAW'}
+
+
+def CanEncodeImage(file_format):
+    """
+    Returns True if PakPal can encode the given file format itself.
+    """
+    return file_format in ENCODABLE_FORMATS
+
+def GetColorModeChannels(pixels, color_mode):
+    """
+    Returns the pixels reduced to the channels used by the color mode.
+    """
+    match color_mode:
+        case 'BW':
+            luminance = np.dot(pixels[..., :3], LUMINANCE_WEIGHTS)[..., None]
+            if np.issubdtype(pixels.dtype, np.integer):
+                luminance = np.rint(luminance).astype(pixels.dtype)
+            return luminance
+        case 'RGB':
+            return pixels[..., :3]
+        case _:
+            return pixels
+
+def GetEncodeDtype(settings):
+    """
+    Returns the integer type the encoder will write pixels as.  Packing straight into this
+    type avoids working with floats for 8 and 16-bit images.
+    """
+    if settings['file_format'] == 'PNG' and settings['color_depth'] == '16':
+        return np.uint16
+    return np.uint8
+
+def QuantizePixels(pixels, bit_depth):
+    """
+    Converts pixels into unsigned integers of the given bit depth.  Float pixels are
+    expected to be normalized, integer pixels are rescaled from their own bit depth.
+    """
+    dtype = np.uint16 if bit_depth == 16 else np.uint8
+    max_value = float(np.iinfo(dtype).max)
+
+    if np.issubdtype(pixels.dtype, np.integer):
+        if pixels.dtype == dtype:
+            return pixels
+        
+        scale = max_value / np.iinfo(pixels.dtype).max
+        return np.rint(pixels.astype(np.float32) * scale).astype(dtype)
+
+    return np.rint(np.clip(pixels, 0.0, 1.0) * max_value).astype(dtype)
+
+def GetEncodeSettings(pak_format):
+    """
+    Copies the settings needed for encoding out of a PAK_ImageFormat, as Blender
+    properties can't be safely read from other threads.
+    """
+    return {
+        'file_format': pak_format.file_format,
+        'color_mode': pak_format.color_mode,
+        'color_depth': pak_format.color_depth,
+        'compression': pak_format.compression,
+    }
+
+def EncodeImage(pixels, settings):
+    """
+    Encodes pixels using settings from GetEncodeSettings(), returning the bytes of the file.
+    """
+    height, width = pixels.shape[:2]
+    return EncodeImageBands(lambda start, end: pixels[start:end], (width, height), 
+                            height, settings)
+
+def EncodeImageFile(pixels, settings, file_path):
+    """
+    Encodes pixels and saves them to the file path.  This doesn't touch any Blender
+    data so it can run on a worker thread.
+    """
+    data = EncodeImage(pixels, settings)
+    with open(file_path, 'wb') as image_file:
+        image_file.write(data)
+
+def EncodeImageBands(get_band, size, band_rows, settings):
+    """
+    Encodes an image one band of rows at a time, so the full image never has to be in memory.
+    
+    get_band(start, end) must return the pixels for rows start to end (in Blender's 
+    bottom-up order), and is called with at most band_rows rows at a time.
+    """
+    match settings['file_format']:
+        case 'PNG':
+            bit_depth = 16 if settings['color_depth'] == '16' else 8
+            return EncodePNG(get_band, size, band_rows, settings['color_mode'], 
+                             bit_depth, settings['compression'])
+        case 'BMP':
+            return EncodeBMP(get_band, size, band_rows, settings['color_mode'])
+        case 'TARGA_RAW':
+            return EncodeTarga(get_band, size, band_rows, settings['color_mode'])
+        case _:
+            return None
+
+def IterBands(height, band_rows, top_down = False):
+    """
+    Yields the (start, end) rows for every band in an image.
+    """
+    starts = range(0, height, band_rows)
+    if top_down:
+        starts = reversed(starts)
+    
+    for start in starts:
+        yield start, min(start + band_rows, height)
+
+
+# //////////////////////////////////////////////////////////////
+# PNG
+
+def PNGChunk(chunk_type, data):
+    chunk = chunk_type + data
+    return struct.pack(">I", len(data)) + chunk + struct.pack(">I", zlib.crc32(chunk))
+
+def EncodePNG(get_band, size, band_rows, color_mode, bit_depth, compression):
+    """
+    Encodes pixels as a PNG file.  Compression uses the same 0-100 range as Blender.
+    """
+    width, height = size
+    channels = {'BW': 1, 'RGB': 3}.get(color_mode, 4)
+    color_type = {1: 0, 3: 2, 4: 6}[channels]
+
+    level = (9 * compression) // 100
+    compressor = zlib.compressobj(level)
+    header = struct.pack(">IIBBBBB", width, height, bit_depth, color_type, 0, 0, 0)
+    result = [b"\x89PNG\r\n\x1a\n", PNGChunk(b"IHDR", header)]
+
+    # PNG rows run top to bottom, and every row starts with a filter type byte (0 = None).
+    for start, end in IterBands(height, band_rows, top_down = True):
+        pixels = GetColorModeChannels(get_band(start, end), color_mode)
+        data = QuantizePixels(pixels[::-1], bit_depth)
+        if bit_depth == 16:
+            data = data.astype('>u2')
+
+        rows = data.reshape(end - start, -1).view(np.uint8)
+        scanlines = np.zeros((end - start, rows.shape[1] + 1), dtype = np.uint8)
+        scanlines[:, 1:] = rows
+
+        compressed = compressor.compress(scanlines.tobytes())
+        if len(compressed) > 0:
+            result.append(PNGChunk(b"IDAT", compressed))
+
+    result.append(PNGChunk(b"IDAT", compressor.flush()))
+    result.append(PNGChunk(b"IEND", b""))
+    return b"".join(result)
+
+
+# //////////////////////////////////////////////////////////////
+# BMP
+
+def EncodeBMP(get_band, size, band_rows, color_mode):
+    """
+    Encodes pixels as an uncompressed 24-bit BMP file (BMP has no alpha support in Blender).
+    """
+    width, height = size
+    row_size = (width * 3 + 3) & ~3
+    image_size = row_size * height
+
+    file_header = struct.pack("<2sIHHI", b"BM", 54 + image_size, 0, 0, 54)
+    info_header = struct.pack("<IiiHHIIiiII", 40, width, height, 1, 24, 0,
+                              image_size, 2835, 2835, 0, 0)
+    result = [file_header, info_header]
+
+    # BMP stores rows bottom-up like Blender, as BGR and padded to 4 bytes.
+    for start, end in IterBands(height, band_rows):
+        pixels = GetColorModeChannels(get_band(start, end), color_mode)
+        data = QuantizePixels(pixels, 8)
+        if data.shape[2] == 1:
+            data = np.repeat(data, 3, axis = 2)
+        
+        rows = np.zeros((end - start, row_size), dtype = np.uint8)
+        rows[:, :width * 3] = data[..., 2::-1].reshape(end - start, -1)
+        result.append(rows.tobytes())
+
+    return b"".join(result)
+
+
+# //////////////////////////////////////////////////////////////
+# TARGA
+
+def EncodeTarga(get_band, size, band_rows, color_mode):
+    """
+    Encodes pixels as an uncompressed Targa file.
+    """
+    width, height = size
+    channels = {'BW': 1, 'RGB': 3}.get(color_mode, 4)
+
+    if channels == 1:
+        image_type, pixel_depth, descriptor, order = 3, 8, 0, [0]
+    elif channels == 3:
+        image_type, pixel_depth, descriptor, order = 2, 24, 0, [2, 1, 0]
+    else:
+        image_type, pixel_depth, descriptor, order = 2, 32, 8, [2, 1, 0, 3]
+
+    header = struct.pack("<BBBHHBHHHHBB", 0, 0, image_type, 0, 0, 0, 0, 0,
+                         width, height, pixel_depth, descriptor)
+    result = [header]
+
+    # Targa stores rows bottom-up like Blender, as BGR(A).
+    for start, end in IterBands(height, band_rows):
+        pixels = GetColorModeChannels(get_band(start, end), color_mode)
+        data = QuantizePixels(pixels, 8)
+        result.append(np.ascontiguousarray(data[..., order]).tobytes())
+
+    return b"".join(result)
@@ -13,9 +13,9 @@ from bpy.props import (
 
 def PAK_Update_ImageFormatProxies(self, context):
 
-    addon_prefs = context.preferences.addons[__package__].preferences
-    file_data = bpy.data.objects[addon_prefs.pak_filedata_name].PAK_FileData
-    current_format = file_data.formats[file_data.formats_list_index]
+    # Formats are also used by the image packer and it's recipes, so only edit the
+    # format that was changed.
+    current_format = self
 
     # TODO: Different formats MUST have certain color depths or modes set when
     # no options are available.
@@ -314,6 +314,30 @@ def LoadImageFormat(pak_format : PAK_ImageFormat, blender_format : ImageFormatSe
     # blender_format.view_settings = pak_format.view_settings
     # blender_format.views_format = pak_format.views_format
 
+def GetImageFormatKey(pak_format : PAK_ImageFormat):
+    """
+    Returns every format setting that changes a saved image, for comparing formats.
+    """
+
+    return (
+        pak_format.file_format,
+        pak_format.color_depth,
+        pak_format.color_management,
+        pak_format.color_mode,
+        pak_format.compression,
+        pak_format.quality,
+        pak_format.cineon_black,
+        pak_format.cineon_gamma,
+        pak_format.cineon_white,
+        pak_format.use_cineon_log,
+        pak_format.jpeg2k_codec,
+        pak_format.use_jpeg2k_cinema_48,
+        pak_format.use_jpeg2k_cinema_preset,
+        pak_format.use_jpeg2k_ycc,
+        pak_format.tiff_codec,
+        pak_format.use_preview,
+    )
+
 
 
 # When using image.save_render it doesn't add the file extension for you, so
@@ -1,6 +1,8 @@
-import bpy, os
+import bpy, os, time, hashlib, zlib
 import numpy as np
-from bpy.types import Menu, Panel, Operator
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from bpy.types import Menu, Panel, Operator, UIList
 from bpy.props import EnumProperty
 
 from bl_ui.utils import PresetPanel
@@ -9,9 +11,30 @@ from bl_operators.presets import AddPresetBase
 from .main_menu import PAK_UI_CreateSelectionHeader
 from .export_locations import *
 from .material_slots import FindMaterialSlotInName
+from .bundle_index import bundle_index, selection_cache
+from .operators import (
+    GetSelection, RecordThroughput, PAK_ModalProgress, LAST_RUN_INFO, RUNS_IN_PROGRESS
+)
+from .pipeline_scene import (
+    GetPipelineScene, 
+    SetPackNodes, 
+    RenderPipelineScene, 
+    ClearPipelineImages,
+)
+from .image_pack_engine import (
+    PixelCache, 
+    ReadImagePixels, 
+    WriteImagePixels, 
+    PackImageChannels,
+    PackAndEncodeImage,
+    GetBandRows,
+    GetPackSize,
+)
+from .image_encode import CanEncodeImage, EncodeImage, GetEncodeSettings, GetEncodeDtype
 from .image_format_properties import (
     LoadImageFormat, 
     GetImageFileExtension,
+    GetImageFormatKey,
     UI_CreateFormatSettings
 )
 
@@ -101,6 +124,224 @@ class PAK_PT_ImagePack_PresetsOps(PresetPanel, Panel):
     preset_operator = "script.execute_preset"
     preset_add_operator = "pak.add_image_pack_preset"
 
+# //////////////////////////////////////////////////////////////
+# //////////////////////////////////////////////////////////////
+# PACK RECIPES
+
+def GetPackSettings(file_data):
+    """
+    Returns the pack settings currently being edited, either the selected recipe
+    or the single pack stored in the file data.
+    """
+    if file_data.use_pack_recipes:
+        if 0 <= file_data.pack_recipes_list_index < len(file_data.pack_recipes):
+            return file_data.pack_recipes[file_data.pack_recipes_list_index]
+        return None
+    
+    return file_data
+
+def GetPackRecipes(file_data):
+    """
+    Returns all the pack settings that should be packed for every bundle.
+    """
+    if file_data.use_pack_recipes:
+        return [r for r in file_data.pack_recipes if r.enabled]
+    
+    return [file_data]
+
+class PAK_OT_AddPackRecipe(Operator):
+    """Create a new Image Pack Recipe"""
+
+    bl_idname = "pak.add_pack_recipe"
+    bl_label = "Add Pack Recipe"
+
+    @classmethod
+    def poll(cls, context):
+        # Image packs hold onto the recipes while they run.
+        return len(RUNS_IN_PROGRESS) == 0
+
+    def execute(self, context):
+
+        try:
+            addon_prefs = context.preferences.addons[__package__].preferences
+            file_data = bpy.data.objects[addon_prefs.pak_filedata_name].PAK_FileData
+        except:
+            return {'CANCELLED'}
+
+        new_recipe = file_data.pack_recipes.add()
+        new_recipe.name = "Recipe " + str(len(file_data.pack_recipes))
+        file_data.pack_recipes_list_index = len(file_data.pack_recipes) - 1
+
+        return {'FINISHED'}
+
+class PAK_OT_DeletePackRecipe(Operator):
+    """Delete the selected Image Pack Recipe"""
+
+    bl_idname = "pak.delete_pack_recipe"
+    bl_label = "Remove Pack Recipe"
+
+    @classmethod
+    def poll(cls, context):
+        # Image packs hold onto the recipes while they run.
+        return len(RUNS_IN_PROGRESS) == 0
+
+    def execute(self, context):
+
+        try:
+            addon_prefs = context.preferences.addons[__package__].preferences
+            file_data = bpy.data.objects[addon_prefs.pak_filedata_name].PAK_FileData
+        except:
+            return {'CANCELLED'}
+
+        sel_index = file_data.pack_recipes_list_index
+        if sel_index < 0 or sel_index >= len(file_data.pack_recipes):
+            return {'CANCELLED'}
+        
+        file_data.pack_recipes.remove(sel_index)
+
+        # ensure the selected list index is within the list bounds
+        if len(file_data.pack_recipes) > 0 and sel_index != 0:
+            file_data.pack_recipes_list_index -= 1
+
+        return {'FINISHED'}
+
+class PAK_UL_PackRecipeList(UIList):
+    def draw_item(self, context, layout, data, item, icon, active_data, active_propname):
+
+        layout.prop(item, "enabled", text = "")
+        layout.prop(item, "name", text = "", emboss = False)
+        layout.label(text = item.packed_image_suffix)
+
+def GetImageForSlot(addon_prefs, file_data, bundle, source_slots):
+    """
+    Returns the first image in the bundle that matches one of the given source slot names.
+    Images without any pixels (like ones with a missing file) are skipped.
+    """
+    if source_slots == "":
+        return None
+    
+    source_slots = source_slots.replace(",", "")
+    source_slot_strings = source_slots.split()
+
+    for bundle_item in bundle.pak_items:
+        filename = os.path.splitext(bundle_item.tex.name)[0]
+        match = FindMaterialSlotInName(addon_prefs, filename, source_slot_strings,
+                                       file_data.case_sensitive_matching)
+
+        if match and bundle_item.tex.size[0] * bundle_item.tex.size[1] > 0:
+            return bundle_item.tex
+    
+    return None
+
+def GetPackSources(addon_prefs, file_data, bundle, pack_settings):
+    """
+    Returns the R, G, B and A source images a recipe would use for a bundle.
+    """
+    return (GetImageForSlot(addon_prefs, file_data, bundle, pack_settings.pack_r_source),
+            GetImageForSlot(addon_prefs, file_data, bundle, pack_settings.pack_g_source),
+            GetImageForSlot(addon_prefs, file_data, bundle, pack_settings.pack_b_source),
+            GetImageForSlot(addon_prefs, file_data, bundle, pack_settings.pack_a_source))
+
+def GetPackFilePath(file_data, bundle, pack_settings, create_directory = True):
+    """
+    Returns the name and file path of the image a recipe makes for a bundle.
+    """
+    file_name = bundle.name + pack_settings.packed_image_suffix
+    file_ext = GetImageFileExtension(pack_settings.pack_format.file_format)
+
+    # Images that don't need a file copy still get a relative path, so
+    # they can be unpacked later.
+    if file_data.pack_save_copy:
+        file_directory = CreateFilePath(file_data.temp_bake_path, 
+                                        create_directory = create_directory)
+    else:
+        file_directory = "//"
+    
+    return file_name, file_directory + file_name + file_ext
+
+def IsPackUnchanged(file_data, file_name, file_path, fingerprint):
+    """
+    Returns True if an image was already packed from the same sources and settings.
+    """
+    if file_data.force_image_pack or fingerprint is None:
+        return False
+    
+    if file_name not in bpy.data.images:
+        return False
+    
+    if bpy.data.images[file_name].PAK_Img.pack_fingerprint != fingerprint:
+        return False
+    
+    # A missing file copy still needs to be saved again.
+    return file_data.pack_save_copy is False or os.path.exists(bpy.path.abspath(file_path))
+
+# //////////////////////////////////////////////////////////////
+# //////////////////////////////////////////////////////////////
+# PACK FINGERPRINTS
+# Packed images store a hash of everything used to make them, so bundles that 
+# haven't changed can be skipped when packing again.
+
+def GetSourceFingerprint(image):
+    """
+    Returns something that changes whenever the contents of the image change, or None
+    if PakPal can't tell (like when an image has unsaved edits).
+    """
+    if image.is_dirty:
+        return None
+    
+    if image.packed_file is not None:
+        return ('PACKED', image.packed_file.size, zlib.crc32(image.packed_file.data))
+    
+    match image.source:
+        case 'FILE':
+            try:
+                file_stat = os.stat(bpy.path.abspath(image.filepath, library = image.library))
+            except OSError:
+                return None
+            return ('FILE', image.filepath, file_stat.st_mtime_ns, file_stat.st_size)
+        
+        case 'GENERATED':
+            return ('GENERATED', image.generated_type, tuple(image.generated_color),
+                    image.generated_width, image.generated_height, image.use_generated_float)
+        
+        case _:
+            return None
+
+def GetPackFingerprint(file_data, pack_settings, sources, source_fingerprints):
+    """
+    Returns a hash of the R, G, B and A source images and every setting used to pack them,
+    or None if any source can't be fingerprinted.
+
+    source_fingerprints is used to store source fingerprints between bundles and recipes,
+    as hashing packed images isn't free.
+    """
+    pack_info = []
+
+    for image in sources:
+        if image is None:
+            pack_info.append(None)
+            continue
+
+        if image.name_full not in source_fingerprints:
+            source_fingerprints[image.name_full] = GetSourceFingerprint(image)
+        
+        source_fingerprint = source_fingerprints[image.name_full]
+        if source_fingerprint is None:
+            return None
+        
+        pack_info.append((image.name_full, tuple(image.size), 
+                          image.colorspace_settings.name, source_fingerprint))
+    
+    pack_info.append((pack_settings.pack_r_channel, pack_settings.pack_g_channel,
+                      pack_settings.pack_b_channel, pack_settings.pack_a_channel))
+    pack_info.append((pack_settings.pack_r_invert, pack_settings.pack_g_invert,
+                      pack_settings.pack_b_invert, pack_settings.pack_a_invert))
+    pack_info.append(GetImageFormatKey(pack_settings.pack_format))
+    pack_info.append((file_data.pack_engine, file_data.pack_resolution_policy,
+                      tuple(file_data.pack_resolution), file_data.pack_resample_filter))
+
+    return hashlib.sha1(repr(pack_info).encode()).hexdigest()
+
 # //////////////////////////////////////////////////////////////
 # //////////////////////////////////////////////////////////////
 # SLOT ADD SYSTEM
@@ -153,6 +394,10 @@ class PAK_OT_ImagePack_AddSlotName(Operator):
         except:
             return {'CANCELLED'}
         
+        pack_settings = GetPackSettings(file_data)
+        if pack_settings is None:
+            return {'CANCELLED'}
+        
         # This feels wrong, but I couldn't work out a nicer way D:
         slot_name = self.GetSlots(context)[int(self.slots)][1]
         if self.path_target != 'RESULT':
@@ -160,15 +405,15 @@ class PAK_OT_ImagePack_AddSlotName(Operator):
 
         match self.path_target:
             case 'R':
-                file_data.pack_r_source += slot_name
+                pack_settings.pack_r_source += slot_name
             case 'G':
-                file_data.pack_g_source += slot_name
+                pack_settings.pack_g_source += slot_name
             case 'B':
-                file_data.pack_b_source += slot_name
+                pack_settings.pack_b_source += slot_name
             case 'A':
-                file_data.pack_a_source += slot_name
+                pack_settings.pack_a_source += slot_name
             case 'RESULT':
-                file_data.packed_image_suffix = slot_name
+                pack_settings.packed_image_suffix = slot_name
             case _:
                 pass
         return {'FINISHED'}
@@ -250,17 +495,64 @@ class PAK_PT_ImagePackMenu(Panel):
         pack_select_options.separator()
         pack_select_options.prop(file_data, "overwrite_image_pack")
         pack_select_options.prop(file_data, "add_fake_user")
+        pack_select_options.prop(file_data, "force_image_pack")
+        pack_select_options.separator()
+        pack_select_options.prop(file_data, "pack_engine")
+
+        pack_cache_options = pack_select_options.column(align = True)
+        pack_cache_options.active = file_data.pack_engine == 'NUMPY'
+        pack_cache_options.prop(file_data, "pack_cache_limit")
+        pack_cache_options.prop(file_data, "pack_worker_count")
+        pack_cache_options.separator()
+        pack_cache_options.prop(file_data, "pack_tiled")
+        pack_tile_options = pack_cache_options.column(align = True)
+        pack_tile_options.active = file_data.pack_tiled
+        pack_tile_options.prop(file_data, "pack_tile_memory")
+        pack_cache_options.separator()
+        pack_cache_options.prop(file_data, "pack_resolution_policy")
+        if file_data.pack_resolution_policy == 'FIXED':
+            pack_cache_options.prop(file_data, "pack_resolution")
+        pack_cache_options.prop(file_data, "pack_resample_filter")
         pack_select_options.separator()
-        pack_select_options.prop(file_data, "temp_bake_path")
+
+        pack_select_options.prop(file_data, "pack_save_copy")
+        pack_save_options = pack_select_options.column(align = True)
+        pack_save_options.active = file_data.pack_save_copy
+        pack_save_options.prop(file_data, "temp_bake_path")
         # bake_menu.separator()
         pack_select_options.separator()
         pack_select_options.separator()
 
         pack_operator = pack_select_options.column(align = False)
         pack_operator.operator("pak.create_image_pack", icon = "NODE_COMPOSITING")
+        pack_operator.operator("pak.plan_run", icon = "TIME", text = "Plan Image Pack").plan_mode = 'PACK'
         pack_test.separator()
 
 
+        # ////////////////////////////////
+        # PACK RECIPES
+        pack_recipe_box = pack_test.box()
+        pack_recipe_title = pack_recipe_box.row(align = True)
+        pack_recipe_title.label(text = "Image Pack Recipes", icon = "PRESET")
+        pack_recipe_title.prop(file_data, "use_pack_recipes", text = "")
+
+        if file_data.use_pack_recipes:
+            pack_recipe_list = pack_test.row(align = True)
+            pack_recipe_list.template_list("PAK_UL_PackRecipeList", "default", file_data, 
+                                           "pack_recipes", file_data, "pack_recipes_list_index", 
+                                           rows = 3, maxrows = 6)
+            pack_recipe_list.separator()
+
+            pack_recipe_ops = pack_recipe_list.column(align = True)
+            pack_recipe_ops.operator("pak.add_pack_recipe", text = "", icon = "ADD")
+            pack_recipe_ops.operator("pak.delete_pack_recipe", text = "", icon = "REMOVE")
+        
+        pack_test.separator()
+
+        pack_settings = GetPackSettings(file_data)
+        if pack_settings is None:
+            return
+
         # ////////////////////////////////
         # PACK SLOTS
         pack_slots_box = pack_test.box()
@@ -269,55 +561,55 @@ class PAK_PT_ImagePackMenu(Panel):
         pack_test.separator()
 
         pack_test_r_source = pack_test.row(align = True)
-        pack_test_r_source.prop(file_data, "pack_r_source", text = "Red Source")
+        pack_test_r_source.prop(pack_settings, "pack_r_source", text = "Red Source")
         pack_test_r_source.operator_menu_enum('pak.add_image_pack_slot_name', "slots",
                                               text = "",
                                               icon = "ADD").path_target = 'R'
         
         pack_test_r_channel = pack_test.row(align = False)
-        pack_test_r_channel.prop(file_data, "pack_r_channel", expand = True)
-        pack_test.prop(file_data, "pack_r_invert", text = "Invert")
+        pack_test_r_channel.prop(pack_settings, "pack_r_channel", expand = True)
+        pack_test.prop(pack_settings, "pack_r_invert", text = "Invert")
         pack_test.separator()
         pack_test.separator()
 
         pack_test_g_source = pack_test.row(align = True)
-        pack_test_g_source.prop(file_data, "pack_g_source", text = "Green Source")
+        pack_test_g_source.prop(pack_settings, "pack_g_source", text = "Green Source")
         pack_test_g_source.operator_menu_enum('pak.add_image_pack_slot_name', "slots",
                                               text = "",
                                               icon = "ADD").path_target = 'G'
         
         pack_test_g_source = pack_test.row(align = False)
-        pack_test_g_source.prop(file_data, "pack_g_channel", expand = True)
-        pack_test.prop(file_data, "pack_g_invert", text = "Invert")
+        pack_test_g_source.prop(pack_settings, "pack_g_channel", expand = True)
+        pack_test.prop(pack_settings, "pack_g_invert", text = "Invert")
         pack_test.separator()
         pack_test.separator()
 
         pack_test_b_source = pack_test.row(align = True)
-        pack_test_b_source.prop(file_data, "pack_b_source", text = "Blue Source")
+        pack_test_b_source.prop(pack_settings, "pack_b_source", text = "Blue Source")
         pack_test_b_source.operator_menu_enum('pak.add_image_pack_slot_name', "slots",
                                               text = "",
                                               icon = "ADD").path_target = 'B'
         
         pack_test_b_source = pack_test.row(align = False)
-        pack_test_b_source.prop(file_data, "pack_b_channel", expand = True)
-        pack_test.prop(file_data, "pack_b_invert", text = "Invert")
+        pack_test_b_source.prop(pack_settings, "pack_b_channel", expand = True)
+        pack_test.prop(pack_settings, "pack_b_invert", text = "Invert")
         pack_test.separator()
         pack_test.separator()
 
         pack_test_a_source = pack_test.row(align = True)
-        pack_test_a_source.prop(file_data, "pack_a_source", text = "Alpha Source")
+        pack_test_a_source.prop(pack_settings, "pack_a_source", text = "Alpha Source")
         pack_test_a_source.operator_menu_enum('pak.add_image_pack_slot_name', "slots",
                                               text = "",
                                               icon = "ADD").path_target = 'A'
         
         pack_test_a_source = pack_test.row(align = False)
-        pack_test_a_source.prop(file_data, "pack_a_channel", expand = True)
-        pack_test.prop(file_data, "pack_a_invert", text = "Invert")
+        pack_test_a_source.prop(pack_settings, "pack_a_channel", expand = True)
+        pack_test.prop(pack_settings, "pack_a_invert", text = "Invert")
         pack_test.separator()
         pack_test.separator()
         
         pack_test_result = pack_test.row(align = True)
-        pack_test_result.prop(file_data, "packed_image_suffix")
+        pack_test_result.prop(pack_settings, "packed_image_suffix")
         pack_test_result.operator_menu_enum('pak.add_image_pack_slot_name', "slots",
                                              text = "",
                                              icon = "TRIA_DOWN").path_target = 'RESULT'
@@ -336,7 +628,7 @@ class PAK_PT_ImagePackMenu(Panel):
             pack_format_options.use_property_decorate = False
             pack_format_options.separator()
             # TODO: Add color management
-            pack_format = file_data.pack_format
+            pack_format = pack_settings.pack_format
             UI_CreateFormatSettings(pack_format_options, pack_format)
             pack_format_options.separator()
             pack_format_options.separator()
@@ -354,7 +646,7 @@ class PAK_PT_ImagePackMenu(Panel):
 # IMAGE PACK OPERATOR
 
 
-class PAK_OT_CreateImagePack(Operator):
+class PAK_OT_CreateImagePack(PAK_ModalProgress, Operator):
     """Creates a new packed image based on channels from existing images found within a bundle.
 
     NOTE - You'll need to select at least one bundle from the PakPal image list in order to create a packed image"""
@@ -362,289 +654,452 @@ class PAK_OT_CreateImagePack(Operator):
     bl_idname = "pak.create_image_pack"
     bl_label = "Create Image Pack From Selection"
 
-    # Thanks!
-    # https://blender.stackexchange.com/questions/19500/controling-compositor-by-python
-    # https://docs.blender.org/api/current/bpy.types.CompositorNode.html
-    def create_compositor_packer(self):
-        
-        bpy.context.scene.use_nodes = True
-        tree = bpy.context.scene.node_tree
-        links = tree.links
-
-        # clear default nodes
-        for node in tree.nodes:
-            tree.nodes.remove(node)
-
-        # BUILD IMAGES
-        # NOTE: Image color output includes the alpha channel
-        r_image_node = tree.nodes.new(type = 'CompositorNodeImage')
-        r_image_node.image = self.source_r
-        r_image_node.location = 0,0
-
-        g_image_node = tree.nodes.new(type = 'CompositorNodeImage')
-        g_image_node.image = self.source_g
-        g_image_node.location = 0,-350
-
-        b_image_node = tree.nodes.new(type = 'CompositorNodeImage')
-        b_image_node.image = self.source_b
-        b_image_node.location = 0,-700
-
-        a_image_node = tree.nodes.new(type = 'CompositorNodeImage')
-        a_image_node.image = self.source_a
-        a_image_node.location = 0,-1050
-
-        # BUILD INVERTS
-        # TODO : Check back later when a useful copy function becomes available.
-        r_invert = tree.nodes.new(type = 'CompositorNodeInvert')
-        r_invert.location = 250,0
-        r_invert.invert_alpha = True
-        r_invert_fac = r_invert.inputs['Fac']
-        r_invert_fac.default_value = self.invert_r
-
-        g_invert = tree.nodes.new(type = 'CompositorNodeInvert')
-        g_invert.location = 250,-350
-        g_invert.invert_alpha = True
-        g_invert_fac = g_invert.inputs['Fac']
-        g_invert_fac.default_value = self.invert_g
-
-        b_invert = tree.nodes.new(type = 'CompositorNodeInvert')
-        b_invert.location = 250,-700
-        b_invert.invert_alpha = True
-        b_invert_fac = b_invert.inputs['Fac']
-        b_invert_fac.default_value = self.invert_b
-
-        a_invert = tree.nodes.new(type = 'CompositorNodeInvert')
-        a_invert.location = 250,-1050
-        a_invert.invert_alpha = True
-        a_invert_fac = a_invert.inputs['Fac']
-        a_invert_fac.default_value = self.invert_a
-
-        links.new(r_image_node.outputs[0], r_invert.inputs[1])
-        links.new(g_image_node.outputs[0], g_invert.inputs[1])
-        links.new(b_image_node.outputs[0], b_invert.inputs[1])
-        links.new(a_image_node.outputs[0], a_invert.inputs[1])
-
-        # BUILD SEPARATORS
-        r_separate = tree.nodes.new(type = 'CompositorNodeSeparateColor')
-        r_separate.mode = 'RGB'
-        r_separate.location = 500,0
-        g_separate = tree.nodes.new(type = 'CompositorNodeSeparateColor')
-        g_separate.mode = 'RGB'
-        g_separate.location = 500,-350
-        b_separate = tree.nodes.new(type = 'CompositorNodeSeparateColor')
-        b_separate.mode = 'RGB'
-        b_separate.location = 500,-700
-        a_separate = tree.nodes.new(type = 'CompositorNodeSeparateColor')
-        a_separate.mode = 'RGB'
-        a_separate.location = 500,-1050
-
-        links.new(r_invert.outputs[0], r_separate.inputs[0])
-        links.new(g_invert.outputs[0], g_separate.inputs[0])
-        links.new(b_invert.outputs[0], b_separate.inputs[0])
-        links.new(a_invert.outputs[0], a_separate.inputs[0])
-        
-        # BUILD COMBINE
-        def make_separate_link(separate_node, target_output, combine_node, target_input):
-            color_slot = {'R': 0, 'G': 1, 'B':2, 'A':3}
-            color_input = color_slot[target_output]
-            color_output = color_slot[target_input]
-            links.new(separate_node.outputs[color_input], combine_node.inputs[color_output])
-
-        combine_color = tree.nodes.new(type = 'CompositorNodeCombineColor')
-        combine_color.location = 750,-550
-        combine_color.update()
-
-        if self.source_r is not None:
-            make_separate_link(r_separate, self.channel_r, combine_color, 'R')
-        if self.source_g is not None:
-            make_separate_link(g_separate, self.channel_g, combine_color, 'G')
-        if self.source_b is not None:
-            make_separate_link(b_separate, self.channel_b, combine_color, 'B')
-        if self.source_a is not None:
-            make_separate_link(a_separate, self.channel_a, combine_color, 'A')
-
-        # ADD OUTPUT
-        output_node = tree.nodes.new(type = 'CompositorNodeViewer')
-        output_node.location = 1000, -550
-
-        # output_node = tree.nodes.new(type = 'CompositorNodeOutputFile')
-        # output_node.location = 1000, -550
-        # output_node.base_path = self.file_directory
-        # output_node.file_slots[0].path = self.file_name + ".png"
-        # output_node.file_slots[0].save_as_render = False
-        
-        links.new(combine_color.outputs[0], output_node.inputs[0])
-
-        # This renders whatever is on the compositor.
-        # When using a File Output node it will forcefully add a frame number to the end.
-        bpy.ops.render.render(animation=False, write_still=False, use_viewport=False, layer="", scene="")
+    progress_label = "PakPal Image Pack"
 
-    
-    def execute(self, context):
-
-        try:
-            addon_prefs = context.preferences.addons[__package__].preferences
-            file_data = bpy.data.objects[addon_prefs.pak_filedata_name].PAK_FileData
-        except:
-            return {'CANCELLED'}
-        
-        def get_image_for_slot(bundle, source_slots):
-            if source_slots == "":
-                return None
-            
-            source_slots = source_slots.replace(",", "")
-            source_slot_strings = source_slots.split()
-            source_slot_strings = [s for s in source_slot_strings]
+    set_mode: EnumProperty(
+        name = "Pack Mode",
+        items = [
+            ('SELECTED', "Selected", "Packs the currently selected bundles"),
+            ('ALL', "All", "Packs every bundle"),
+            ],
+        default = 'SELECTED',
+        options = {'HIDDEN'},
+    )
 
-            for bundle_item in bundle.pak_items:
-                filename = os.path.splitext(bundle_item.tex.name)[0]
-                match = FindMaterialSlotInName(addon_prefs, filename, source_slot_strings,
-                                               file_data.case_sensitive_matching)
+    def create_compositor_packer(self, pipeline_scene):
+        """
+        Packs the source channels using the pipeline scene's compositor graph, returning
+        the viewer image it was rendered to.
+        """
 
-                if match:
-                    return bundle_item.tex
-            
-            return None
+        SetPackNodes(pipeline_scene, 
+                     [self.source_r, self.source_g, self.source_b, self.source_a],
+                     [self.channel_r, self.channel_g, self.channel_b, self.channel_a],
+                     [self.invert_r, self.invert_g, self.invert_b, self.invert_a])
         
-        if file_data.enable_bundles is False:
-            self.report({'WARNING'}, "Image packing requires Bundles to be enabled.")
-            return {'FINISHED'}
-        
-        # /////////////////////////////////////////////////////////////////
-        # BUILD SCENE
+        return RenderPipelineScene(pipeline_scene, "Pack Viewer")
+
+    def get_numpy_sources(self, file_data, pixel_cache, use_tiles = False, dtype = np.float32):
+        """
+        Returns the source pixels, channels and inverts for every output channel, along
+        with the size of the packed image.  When using tiles only the channels being
+        packed are read and kept.
+
+        Sources that don't match the size of the packed image are resampled to fit.
+        """
+
+        sources = [self.source_r, self.source_g, self.source_b, self.source_a]
+        channels = [self.channel_r, self.channel_g, self.channel_b, self.channel_a]
+        inverts = [self.invert_r, self.invert_g, self.invert_b, self.invert_a]
+
+        source_sizes = set(tuple(s.size) for s in sources if s is not None)
+        size = GetPackSize(source_sizes, file_data.pack_resolution_policy, 
+                           file_data.pack_resolution)
+        filter_type = file_data.pack_resample_filter
+        self.is_resized = len(source_sizes) > 1 or size not in source_sizes
+
+        # The cache makes sure each unique image is only read once per run.
+        pack_sources = []
+        for source, channel, invert in zip(sources, channels, inverts):
+            pixels = None
+            if source is not None and use_tiles:
+                pixels = pixel_cache.get_channel(source, channel, dtype, size, filter_type)
+            elif source is not None:
+                pixels = pixel_cache.get(source, dtype, size, filter_type)
+            
+            pack_sources.append((pixels, channel, invert))
         
-        # NOTE - The context won't actually change unless we escape the properties context.
-        # Properties > Output has it's own scene context!
-        # TODO: Potentially find a way to change the scene context for just the properties panel.
-        old_type = context.area.type
-        context.area.type = 'VIEW_3D'
-        bpy.ops.scene.new(type = 'NEW')
-        composite_scene = bpy.context.scene
+        return pack_sources, size
 
-        
-        # /////////////////////////////////////////////////////////////////
-        # TRANSFER IMAGE FORMAT SETTINGS
-        # try:
-        pack_format = file_data.pack_format
-        composite_format = composite_scene.render.image_settings
-        LoadImageFormat(pack_format, composite_format)
+    def create_numpy_packer(self, file_data, pixel_cache):
+        """
+        Packs the source channels from their pixel buffers and returns the result.
+        """
 
-        # except:
-        #     bpy.data.scenes.remove(composite_scene, do_unlink = True)
-        #     context.area.type = old_type
+        pack_sources, size = self.get_numpy_sources(file_data, pixel_cache)
+        return PackImageChannels(pack_sources, size)
+    
+    def load_pack_format(self, composite_scene, pack_format):
+        """
+        Loads the format settings used to save packed images into the composite scene.
+        """
+
+        LoadImageFormat(pack_format, composite_scene.render.image_settings)
 
-        #     self.report({'WARNING'}, "Something went wrong with Image Format Settings, check that all properties have been set")
-        #     return {'FINISHED'}
-        
         # Set the composite scene to ensure colors aren't edited
         # It's easier to set it in the fake scene :D
         composite_scene.render.image_settings.color_management = 'OVERRIDE'
         composite_scene.view_settings.view_transform = 'Standard'
         composite_scene.view_settings.look = 'None'
+    
+    def store_packed_image(self, file_name, file_path, data):
+        """
+        Creates or updates the packed image datablock directly from encoded file bytes.
+        """
+
+        new_image = None
+        is_new = file_name not in bpy.data.images
 
-        report_info = {'new_images': 0, 'updated_images': 0, 'not_found': 0, 'not_overwritten': 0}
-        valid_bundles = [file_data.bundles[file_data.bundles_list_index]]
-        if file_data.enable_multiselect:
-            valid_bundles = [b for b in file_data.bundles 
-                            if b.is_selected or file_data.enable_multiselect is False]
+        if is_new:
+            # The size doesn't matter, it gets replaced by the packed data.
+            new_image = bpy.data.images.new(file_name, 8, 8)
+        else:
+            new_image = bpy.data.images[file_name]
+            if new_image.packed_file is not None:
+                new_image.unpack(method = 'REMOVE')
         
+        new_image.pack(data = data, data_len = len(data))
+        new_image.source = 'FILE'
+        new_image.filepath_raw = file_path
+        new_image.name = file_name
+
+        if not is_new:
+            new_image.reload()
         
-        for bundle in valid_bundles:
-            
-            # ///////////////////////////////////////////////////////////////////////////
-            # PREPARE PROPERTIES
-
-            file_ext = GetImageFileExtension(pack_format.file_format)
-
-            file_name = bundle.name + file_data.packed_image_suffix
-            file_directory = CreateFilePath(file_data.temp_bake_path)
-            file_path = file_directory + file_name + file_ext
-
-            # Skip if we aren't allowed to overwrite an image.
-            if file_name in bpy.data.images and file_data.overwrite_image_pack is False:
-                report_info['not_overwritten'] += 1
-                continue
-
-            # Access source, channel and inversion data
-            self.source_r = get_image_for_slot(bundle, file_data.pack_r_source)
-            self.source_g = get_image_for_slot(bundle, file_data.pack_g_source)
-            self.source_b = get_image_for_slot(bundle, file_data.pack_b_source)
-            self.source_a = get_image_for_slot(bundle, file_data.pack_a_source)
-
-            if (self.source_r and self.source_g 
-                and self.source_b and self.source_a is None):
-                report_info['not_found'] += 1
-                continue
-
-            self.channel_r = file_data.pack_r_channel
-            self.channel_g = file_data.pack_g_channel
-            self.channel_b = file_data.pack_b_channel
-            self.channel_a = file_data.pack_a_channel
-
-            self.invert_r = file_data.pack_r_invert
-            self.invert_g = file_data.pack_g_invert
-            self.invert_b = file_data.pack_b_invert
-            self.invert_a = file_data.pack_a_invert
-
-            # ///////////////////////////////////////////////////////////////////////////
-            # COMPOSITE AND RENDER
-            
-            self.create_compositor_packer()
+        return new_image, is_new
+    
+    def load_packed_image(self, file_name, file_path):
+        """
+        Creates or updates the packed image datablock by loading a saved image.
+        """
+
+        new_image = None
+        is_new = file_name not in bpy.data.images
+        
+        if is_new:
+            new_image = bpy.data.images.load(file_path, check_existing = True)
+            new_image.filepath = file_path
+            new_image.name = file_name
+        else:
+            new_image = bpy.data.images[file_name]
+            if new_image.packed_file is not None:
+                new_image.unpack(method = 'REMOVE')
+            new_image.filepath = file_path
+            new_image.name = file_name
+            new_image.reload()
+        
+        new_image.pack()
+        return new_image, is_new
+    
+    def add_packed_image(self, file_data, bundle, new_image, is_new, fingerprint, report_info):
+        """
+        Adds a newly packed image to the bundle it was made from.
+        """
+
+        # An empty fingerprint will always be packed again.
+        new_image.PAK_Img.pack_fingerprint = fingerprint or ""
+
+        # Packed images that were removed from the list (or never refreshed into it)
+        # are added back to the bundle as well.
+        is_listed = False
+        if is_new is False:
+            is_listed = bundle_index.get_image_bundle(file_data.bundles, new_image) is not None
+            report_info['updated_images'] += 1
+        else:
+            report_info['new_images'] += 1
+
+        # The bundle could have been removed while the image was being packed.
+        if is_listed is False and bundle is not None:
+            bundle_proxy = bundle.pak_items[0].tex.PAK_Img
+
+            # add the new image to the bundle!
+            new_bundle_item = bundle.pak_items.add()
+            new_bundle_item.tex = new_image
+            new_bundle_item.tex.PAK_Img.enable_export = bundle_proxy.enable_export
+            new_bundle_item.tex.PAK_Img.export_location = bundle_proxy.export_location
+            bundle_index.add_image(new_image, bundle)
+            selection_cache.invalidate()
+
+        new_image.use_fake_user = file_data.add_fake_user
+        self.progress_done += 1
+    
+    def finish_pending_pack(self, file_data, pending_pack, report_info):
+        """
+        Waits for a packed image being encoded on a worker thread and stores it.
+        """
 
-            # Store the output image in it's own buffer and datablock.
-            viewer = bpy.data.images['Viewer Node']
+        job, bundle_name, file_name, file_path, fingerprint, source_bytes = pending_pack
+        data = job.result()
+        self.pending_source_bytes -= source_bytes
+        bundle = bundle_index.get_bundle(file_data.bundles, bundle_name)
 
-            # use save_render to avoid the viewer node datablock from becoming a FILE type.
-            viewer.save_render(filepath = file_path)
+        new_image, is_new = self.store_packed_image(file_name, file_path, data)
+        self.add_packed_image(file_data, bundle, new_image, is_new, fingerprint, report_info)
+
+    
+    def run(self, context):
+        """
+        Packs every selected bundle, yielding after each image (see PAK_ModalProgress).
+        """
 
-            # ///////////////////////////////////////////////////////////////////////////
-            # LOAD NEW IMAGE
+        try:
+            addon_prefs = context.preferences.addons[__package__].preferences
+            file_data = bpy.data.objects[addon_prefs.pak_filedata_name].PAK_FileData
+        except:
+            return
+        
+        if file_data.enable_bundles is False:
+            self.report({'WARNING'}, "Image packing requires Bundles to be enabled.")
+            return
+        
+        if len(GetPackRecipes(file_data)) == 0:
+            self.report({'WARNING'}, "No pack recipes are enabled.")
+            return
+        
+        # /////////////////////////////////////////////////////////////////
+        # BUILD SCENE
+        
+        use_compositor = file_data.pack_engine == 'COMPOSITOR'
 
-            new_image = None
+        # The pixel packer doesn't render anything, but still uses the scene to save
+        # images with the right format settings.
+        composite_scene = GetPipelineScene(file_data)
+
+        
+        # /////////////////////////////////////////////////////////////////
+        # PREPARE RECIPES
+        # Every recipe is a separate output, but all of them are made from the same
+        # sources while a bundle is being packed.
+
+        report_info = {'new_images': 0, 'updated_images': 0, 'not_found': 0, 'not_overwritten': 0,
+                       'resized': 0, 'unchanged': 0, 'packed_pixels': 0}
+        start_time = time.perf_counter()
+        source_fingerprints = {}
+        pixel_cache = PixelCache(file_data.pack_cache_limit)
+
+        pack_recipes = []
+        for pack_settings in GetPackRecipes(file_data):
+            recipe = {}
+            recipe['settings'] = pack_settings
+            recipe['file_ext'] = GetImageFileExtension(pack_settings.pack_format.file_format)
+            recipe['can_encode'] = CanEncodeImage(pack_settings.pack_format.file_format)
+            recipe['encode_settings'] = GetEncodeSettings(pack_settings.pack_format)
+            recipe['encode_dtype'] = GetEncodeDtype(recipe['encode_settings'])
+
+            # When PakPal can encode the format, bundles are packed and encoded on a thread pool
+            # while the sources for the next bundles are being read.
+            recipe['use_pipeline'] = recipe['can_encode'] and use_compositor is False
+            pack_recipes.append(recipe)
+
+        pending_packs = deque()
+        self.pending_source_bytes = 0
+        source_memory_limit = file_data.pack_cache_limit * 1024 * 1024
+        pack_pool = None
+        if any(recipe['use_pipeline'] for recipe in pack_recipes):
+            pack_pool = ThreadPoolExecutor(max_workers = file_data.pack_worker_count)
+        
+        if self.set_mode == 'ALL':
+            selected_bundles = list(file_data.bundles)
+        else:
+            selected_bundles = GetSelection(file_data)
+
+        # The image list can change between steps, so bundles are found again by name
+        # each time instead of being held onto.
+        bundle_names = [bundle.name for bundle in selected_bundles]
+        self.progress_total = len(bundle_names) * len(pack_recipes)
+
+        # Packing can be cancelled at any yield, so the cleanup always needs to happen.
+        try:
+            for bundle_name in bundle_names:
+
+                # Keep every source read for this bundle until all the recipes are done with it.
+                # Tiled packing is for when that wouldn't fit, so it only keeps what the
+                # cache has room for.
+                if file_data.pack_tiled is False:
+                    pixel_cache.hold()
+
+                for recipe in pack_recipes:
+                    yield
+
+                    bundle = bundle_index.get_bundle(file_data.bundles, bundle_name)
+                    if bundle is None:
+                        report_info['not_found'] += 1
+                        self.progress_done += 1
+                        continue
             
-            if file_name in bpy.data.images:
-                new_image = bpy.data.images[file_name]
-                new_image.unpack(method = 'REMOVE')
-                new_image.filepath = file_path
-                new_image.name = file_name
-                new_image.reload()
+                    # ///////////////////////////////////////////////////////////////////////////
+                    # PREPARE PROPERTIES
+
+                    pack_settings = recipe['settings']
+                    pack_format = pack_settings.pack_format
+                    file_ext = recipe['file_ext']
+                    can_encode = recipe['can_encode']
+                    encode_settings = recipe['encode_settings']
+                    encode_dtype = recipe['encode_dtype']
+
+                    file_name, file_path = GetPackFilePath(file_data, bundle, pack_settings)
+
+                    # Skip if we aren't allowed to overwrite an image.
+                    if file_name in bpy.data.images and file_data.overwrite_image_pack is False:
+                        report_info['not_overwritten'] += 1
+                        self.progress_done += 1
+                        continue
+
+                    # Access source, channel and inversion data
+                    (self.source_r, self.source_g, 
+                     self.source_b, self.source_a) = GetPackSources(addon_prefs, file_data, 
+                                                                    bundle, pack_settings)
+
+                    if (self.source_r is None and self.source_g is None
+                        and self.source_b is None and self.source_a is None):
+                        report_info['not_found'] += 1
+                        self.progress_done += 1
+                        continue
+
+                    # Skip images that were already packed from the same sources and settings.
+                    fingerprint = GetPackFingerprint(file_data, pack_settings, 
+                                                     (self.source_r, self.source_g, 
+                                                      self.source_b, self.source_a),
+                                                     source_fingerprints)
+                
+                    if IsPackUnchanged(file_data, file_name, file_path, fingerprint):
+                        report_info['unchanged'] += 1
+                        self.progress_done += 1
+                        continue
+
+                    self.channel_r = pack_settings.pack_r_channel
+                    self.channel_g = pack_settings.pack_g_channel
+                    self.channel_b = pack_settings.pack_b_channel
+                    self.channel_a = pack_settings.pack_a_channel
+
+                    self.invert_r = pack_settings.pack_r_invert
+                    self.invert_g = pack_settings.pack_g_invert
+                    self.invert_b = pack_settings.pack_b_invert
+                    self.invert_a = pack_settings.pack_a_invert
+
+                    # ///////////////////////////////////////////////////////////////////////////
+                    # COMPOSITE AND RENDER
+                
+                    if recipe['use_pipeline']:
+                        pack_sources, size = self.get_numpy_sources(file_data, pixel_cache, 
+                                                                    file_data.pack_tiled, encode_dtype)
+                        if self.is_resized:
+                            report_info['resized'] += 1
+                        report_info['packed_pixels'] += size[0] * size[1]
+                        self.progress_bytes += size[0] * size[1] * 4
+                        save_path = file_path if file_data.pack_save_copy else None
+
+                        # Tiles keep the memory used by each worker under the limit, rather
+                        # than needing the whole packed image at once.
+                        band_rows = None
+                        if file_data.pack_tiled:
+                            band_rows = GetBandRows(size[0], file_data.pack_tile_memory, encode_dtype)
+
+                        job = pack_pool.submit(PackAndEncodeImage, pack_sources, size, 
+                                               encode_settings, save_path, band_rows)
+                        source_bytes = sum(pixels.nbytes for pixels, _, _ in pack_sources 
+                                           if pixels is not None)
+                        pending_packs.append((job, bundle_name, file_name, file_path, 
+                                              fingerprint, source_bytes))
+                        self.pending_source_bytes += source_bytes
+
+                        # Don't let too many finished images pile up in memory.  With tiles
+                        # the sources waiting to be packed also have to fit in the cache limit,
+                        # though one image is always allowed so large ones can still be packed.
+                        while (len(pending_packs) > file_data.pack_worker_count * 2
+                               or (file_data.pack_tiled and len(pending_packs) > 1
+                                   and self.pending_source_bytes > source_memory_limit)):
+                            self.finish_pending_pack(file_data, pending_packs.popleft(), report_info)
+                    
+                        continue
+
+                    # Blender only reads format settings from a scene.
+                    if use_compositor or can_encode is False:
+                        self.load_pack_format(composite_scene, pack_format)
+
+                    pixels = None
+                    if use_compositor:
+                        viewer = self.create_compositor_packer(composite_scene)
+
+                        if can_encode:
+                            pixels = ReadImagePixels(viewer)
+                
+                    else:
+                        pixels = self.create_numpy_packer(file_data, pixel_cache)
+                        if self.is_resized:
+                            report_info['resized'] += 1
+
+                    if use_compositor:
+                        packed_pixels = viewer.size[0] * viewer.size[1]
+                    else:
+                        packed_pixels = pixels.shape[0] * pixels.shape[1]
+                    report_info['packed_pixels'] += packed_pixels
+                    self.progress_bytes += packed_pixels * 4
+
+                    # ///////////////////////////////////////////////////////////////////////////
+                    # CREATE NEW IMAGE
+
+                    if can_encode:
+                        # Pack the encoded file straight into the .blend, only writing it to
+                        # disk if a copy was asked for.
+                        data = EncodeImage(pixels, encode_settings)
+                        if file_data.pack_save_copy:
+                            with open(file_path, 'wb') as image_file:
+                                image_file.write(data)
+                    
+                        new_image, is_new = self.store_packed_image(file_name, file_path, data)
+
+                    else:
+                        # Blender has to encode every other format, so these take a trip through
+                        # a saved file first.
+                        save_path = file_path
+                        if not file_data.pack_save_copy:
+                            save_path = os.path.join(bpy.app.tempdir, file_name + file_ext)
+
+                        if use_compositor:
+                            # use save_render to avoid the viewer node datablock from becoming a FILE type.
+                            viewer.save_render(filepath = save_path, scene = composite_scene)
+                        else:
+                            pack_image = bpy.data.images.new(".PakPal Pack Buffer", 
+                                                             pixels.shape[1], pixels.shape[0], 
+                                                             alpha = True, 
+                                                             float_buffer = pack_format.color_depth != '8')
+                            WriteImagePixels(pack_image, pixels)
+                            pack_image.save_render(filepath = save_path, scene = composite_scene)
+                            bpy.data.images.remove(pack_image)
+
+                        new_image, is_new = self.load_packed_image(file_name, save_path)
+
+                        if not file_data.pack_save_copy:
+                            new_image.filepath_raw = file_path
+                            os.remove(save_path)
+
+                    self.add_packed_image(file_data, bundle, new_image, is_new, fingerprint, report_info)
+            
+                pixel_cache.release()
 
-                report_info['updated_images'] += 1
-            else:
-                new_image = bpy.data.images.load(file_path, check_existing = True)
-                new_image.filepath = file_path
-                new_image.name = file_name
+            # Collect any images still being packed.
+            while len(pending_packs) > 0:
+                self.finish_pending_pack(file_data, pending_packs.popleft(), report_info)
+                yield
+        
 
-                bundle_proxy = bundle.pak_items[0].tex.PAK_Img
+        finally:
+            if pack_pool is not None:
+                pack_pool.shutdown(cancel_futures = True)
 
-                # add the new image to the bundle!
-                new_bundle_item = bundle.pak_items.add()
-                new_bundle_item.tex = new_image
-                new_bundle_item.tex.PAK_Img.enable_export = bundle_proxy.enable_export
-                new_bundle_item.tex.PAK_Img.export_location = bundle_proxy.export_location
+            report_info['source_reads'] = pixel_cache.misses
+            report_info['sources_reused'] = pixel_cache.hits
+            pixel_cache.clear()
 
-                report_info['new_images'] += 1
+            # Don't keep the last packed sources alive through the pipeline scene.
+            ClearPipelineImages(composite_scene)
 
-            new_image.pack()
-            new_image.use_fake_user = file_data.add_fake_user
+        # Used to estimate how long future runs will take.
+        RecordThroughput(file_data, "pack_seconds_per_megapixel", 
+                         time.perf_counter() - start_time, report_info['packed_pixels'])
+        LAST_RUN_INFO['pack'] = dict(report_info)
+        
 
         # TODO: Delete the saved image once it's been packed. (decided not to right now just in case)
         # TODO: Fully test info statements
 
-        # ///////////////////////////////////////////////////////////////////////////
-        # RESTORE SCENE
-        # Delete the composite scene and change the area context back.
-        bpy.data.scenes.remove(composite_scene, do_unlink = True)
-        context.area.type = old_type
-
         info = ""
         new_image_info = ""
         updated_image_info = ""
         failed_image_info = ""
         not_overwritten_image_info = ""
 
-        print(report_info)
-
         if report_info['new_images'] == 1:
             new_image_info = str(report_info['new_images']) + " new image"
         elif report_info['new_images'] > 1:
@@ -666,7 +1121,8 @@ class PAK_OT_CreateImagePack(Operator):
             not_overwritten_image_info += str(report_info['not_overwritten']) + " images"
         
         if (new_image_info == "" and updated_image_info == "" and 
-             failed_image_info == "" and not_overwritten_image_info == ""):
+             failed_image_info == "" and not_overwritten_image_info == "" and
+             report_info['unchanged'] == 0):
             info = "PakPal couldn't find material slots to pack any selected bundle."
             self.report({'WARNING'}, info)
 
@@ -683,11 +1139,14 @@ class PAK_OT_CreateImagePack(Operator):
                 info += not_overwritten_image_info + " were not overwritten.  "
             
             if failed_image_info != "":
-                info += "material slots for " + failed_image_info + " couldn't be found."
+                info += "material slots for " + failed_image_info + " couldn't be found.  "
+            
+            if report_info['unchanged'] > 0:
+                info += str(report_info['unchanged']) + " were unchanged and skipped.  "
 
-            self.report({'INFO'}, info)
-        
+            if report_info['resized'] > 0:
+                info += str(report_info['resized']) + " had sources with different sizes and were resampled."
 
-        return {'FINISHED'}
+            self.report({'INFO'}, info)
 
 
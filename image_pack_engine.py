@@ -0,0 +1,382 @@
+import bpy
+import numpy as np
+from collections import OrderedDict
+
+from .image_encode import EncodeImage, EncodeImageBands, GetEncodeDtype
+
+# //////////////////////////////////////////////////////////////
+# //////////////////////////////////////////////////////////////
+# NUMPY IMAGE PACKER
+#
+# Packs image channels directly from pixel buffers instead of building
+# and rendering a compositor node tree for every bundle.
+#
+# NOTE: Blender stores pixels bottom-up as flat RGBA floats.  Every array
+# here is shaped (height, width, 4) using that same row order.
+#
+# When PakPal encodes the packed image itself, sources are converted to the
+# encoder's uint8/uint16 type as soon as they are read, so the packing works
+# on integers from then on.  8-bit sources packed into 8-bit images come out
+# bit-exact, and the cache can hold 2-4x more images.
+
+CHANNEL_INDEX = {'R': 0, 'G': 1, 'B': 2, 'A': 3}
+
+# Matches the defaults of an unlinked Combine Color node in the compositor.
+CHANNEL_DEFAULTS = (0.0, 0.0, 0.0, 1.0)
+
+
+def LinearToSRGB(values):
+    """
+    Encodes scene linear values with the sRGB transfer function.
+    """
+    values = np.clip(values, 0.0, 1.0)
+    return np.where(values <= 0.0031308,
+                    values * 12.92,
+                    1.055 * np.power(values, 1.0 / 2.4) - 0.055).astype(np.float32)
+
+def SRGBToLinear(values):
+    """
+    Decodes sRGB encoded values back into scene linear values.
+    """
+    values = np.clip(values, 0.0, 1.0)
+    return np.where(values <= 0.04045,
+                    values / 12.92,
+                    np.power((values + 0.055) / 1.055, 2.4)).astype(np.float32)
+
+
+def GetMaxValue(dtype):
+    """
+    Returns the value used for a fully white channel in the given array type.
+    """
+    if np.issubdtype(dtype, np.integer):
+        return np.iinfo(dtype).max
+    return 1.0
+
+def ConvertPixels(pixels, dtype):
+    """
+    Converts normalized float32 pixels to the given type, reusing the float buffer
+    while doing so.
+    """
+    if dtype == np.float32:
+        return pixels
+    
+    np.clip(pixels, 0.0, 1.0, out = pixels)
+    np.multiply(pixels, GetMaxValue(dtype), out = pixels)
+    np.rint(pixels, out = pixels)
+    return pixels.astype(dtype)
+
+def ReadImagePixels(image, dtype = np.float32):
+    """
+    Reads the pixels of an image into an array shaped (height, width, 4).
+
+    Byte images are returned as their stored values, float images are encoded to sRGB
+    unless they hold non-color data, so both match what the compositor would have written.
+    """
+    width, height = image.size
+    pixels = np.empty(width * height * 4, dtype = np.float32)
+    image.pixels.foreach_get(pixels)
+    pixels = pixels.reshape(height, width, 4)
+
+    if image.is_float and not image.colorspace_settings.is_data:
+        pixels[..., :3] = LinearToSRGB(pixels[..., :3])
+
+    return ConvertPixels(pixels, dtype)
+
+def ReadImageChannel(image, channel, dtype = np.float32):
+    """
+    Reads a single channel of an image into an array shaped (height, width).
+
+    NOTE: Blender can only hand over every pixel at once, so the full image is still
+    read here, but only the channel is kept once this returns.
+    """
+    width, height = image.size
+    pixels = np.empty(width * height * 4, dtype = np.float32)
+    image.pixels.foreach_get(pixels)
+
+    index = CHANNEL_INDEX[channel]
+    plane = pixels.reshape(height, width, 4)[..., index].copy()
+    del pixels
+
+    if index < 3 and image.is_float and not image.colorspace_settings.is_data:
+        plane = LinearToSRGB(plane)
+
+    return ConvertPixels(plane, dtype)
+
+def WriteImagePixels(image, pixels):
+    """
+    Writes a float32 array shaped (height, width, 4) into an image.  Float images
+    are decoded back to scene linear as Blender expects.
+    """
+    if image.is_float:
+        pixels = pixels.copy()
+        pixels[..., :3] = SRGBToLinear(pixels[..., :3])
+
+    image.pixels.foreach_set(pixels.ravel())
+    image.update()
+
+def FitImagePixels(pixels, size, start = 0, end = None):
+    """
+    Fits a pixel array to the given (width, height) using nearest neighbour sampling,
+    in the same way the compositor stretches mismatched inputs to fit the canvas.
+    Only the rows from start to end of the fitted result are returned.
+    """
+    width, height = size
+    end = height if end is None else end
+
+    if pixels.shape[1] == width and pixels.shape[0] == height:
+        return pixels[start:end]
+
+    rows = (np.arange(start, end) * pixels.shape[0]) // height
+    columns = (np.arange(width) * pixels.shape[1]) // width
+    return pixels[rows[:, None], columns[None, :]]
+
+# //////////////////////////////////////////////////////////////
+# RESAMPLING
+#
+# Separable resampling used when the sources of a bundle don't share the same
+# resolution.  Each axis is resampled with a small set of weighted taps per output
+# pixel, which are applied across the whole image at once.
+
+RESAMPLE_SUPPORT = {'BOX': 0.5, 'BILINEAR': 1.0, 'LANCZOS': 3.0}
+
+def GetResampleKernel(filter_type, x):
+    match filter_type:
+        case 'BOX':
+            return ((x >= -0.5) & (x < 0.5)).astype(np.float32)
+        case 'BILINEAR':
+            return np.maximum(0.0, 1.0 - np.abs(x))
+        case 'LANCZOS':
+            return np.where(np.abs(x) < 3.0, np.sinc(x) * np.sinc(x / 3.0), 0.0)
+
+def GetResampleWeights(in_size, out_size, filter_type):
+    """
+    Returns the source indices and weights used to build each output pixel along one axis.
+    """
+    scale = out_size / in_size
+
+    # When shrinking, the kernel is widened so every source pixel contributes.
+    filter_scale = max(1.0, 1.0 / scale)
+    radius = RESAMPLE_SUPPORT[filter_type] * filter_scale
+
+    centers = (np.arange(out_size) + 0.5) / scale
+    first = np.floor(centers - radius).astype(np.int64)
+    taps = int(np.ceil(radius * 2.0)) + 1
+
+    indices = first[:, None] + np.arange(taps)[None, :]
+    weights = GetResampleKernel(filter_type, (indices + 0.5 - centers[:, None]) / filter_scale)
+    weights = weights.astype(np.float32)
+    weights /= np.maximum(weights.sum(axis = 1, keepdims = True), 1e-8)
+
+    # Clamp to the image edges.
+    indices = np.clip(indices, 0, in_size - 1)
+    return indices, weights
+
+def ResampleAxis(pixels, out_size, axis, filter_type):
+    in_size = pixels.shape[axis]
+    if in_size == out_size:
+        return pixels.astype(np.float32, copy = False)
+    
+    indices, weights = GetResampleWeights(in_size, out_size, filter_type)
+
+    result_shape = list(pixels.shape)
+    result_shape[axis] = out_size
+    result = np.zeros(result_shape, dtype = np.float32)
+
+    # Weights need to line up with the axis being resampled.
+    weight_shape = [1] * pixels.ndim
+    weight_shape[axis] = out_size
+
+    for tap in range(indices.shape[1]):
+        taken = np.take(pixels, indices[:, tap], axis = axis)
+        result += taken * weights[:, tap].reshape(weight_shape)
+
+    return result
+
+def ResampleImagePixels(pixels, size, filter_type):
+    """
+    Resamples pixels (either RGBA or single channel) to the given (width, height),
+    keeping the type of the original array.
+    """
+    width, height = size
+    if pixels.shape[1] == width and pixels.shape[0] == height:
+        return pixels
+    
+    result = ResampleAxis(pixels, width, 1, filter_type)
+    result = ResampleAxis(result, height, 0, filter_type)
+
+    if np.issubdtype(pixels.dtype, np.integer):
+        np.clip(result, 0, GetMaxValue(pixels.dtype), out = result)
+        np.rint(result, out = result)
+    
+    return result.astype(pixels.dtype)
+
+def GetPackSize(sizes, policy, fixed_size):
+    """
+    Returns the (width, height) a packed image should use from the sizes of its sources.
+    """
+    match policy:
+        case 'SMALLEST':
+            return (min(s[0] for s in sizes), min(s[1] for s in sizes))
+        case 'FIXED':
+            return tuple(fixed_size)
+        case _:
+            return (max(s[0] for s in sizes), max(s[1] for s in sizes))
+
+
+def PackImageChannels(sources, size, start = 0, end = None, dtype = np.float32):
+    """
+    Builds a new RGBA pixel array from a list of four (pixels, channel, invert) sources,
+    one for each output channel.  Any channel without source pixels uses the same default
+    as an unlinked compositor input.
+
+    Sources can either be full RGBA pixels or single channel arrays from ReadImageChannel(),
+    and must already use the given array type.  Only the rows from start to end of the 
+    packed image are built.
+    """
+    width, height = size
+    end = height if end is None else end
+    result = np.empty((end - start, width, 4), dtype = dtype)
+    max_value = GetMaxValue(dtype)
+
+    for i, (pixels, channel, invert) in enumerate(sources):
+        if pixels is None:
+            result[..., i] = CHANNEL_DEFAULTS[i] * max_value
+            continue
+
+        pixels = FitImagePixels(pixels, size, start, end)
+        if pixels.ndim == 3:
+            pixels = pixels[..., CHANNEL_INDEX[channel]]
+        result[..., i] = pixels
+
+        if invert:
+            np.subtract(max_value, result[..., i], out = result[..., i])
+
+    return result
+
+def GetBandRows(width, memory_limit, dtype = np.float32):
+    """
+    Returns how many rows can be packed and encoded at once within a memory limit
+    (in megabytes).  Each row needs an RGBA row plus the working copies made
+    while encoding it.
+    """
+    row_size = width * 4 * np.dtype(dtype).itemsize * 3
+    return max(1, (memory_limit * 1024 * 1024) // row_size)
+
+def PackAndEncodeImage(sources, size, encode_settings, file_path = None, band_rows = None):
+    """
+    Packs and encodes an image in one go, optionally saving the encoded file.  This
+    doesn't touch any Blender data so it can run on a worker thread (numpy and zlib
+    both release the GIL while they work).
+
+    Sources should use the type from GetEncodeDtype().  If band_rows is given the image
+    is packed and encoded in bands of rows, so the full packed image is never held in memory.
+    """
+    dtype = GetEncodeDtype(encode_settings)
+
+    if band_rows is None:
+        pixels = PackImageChannels(sources, size, dtype = dtype)
+        data = EncodeImage(pixels, encode_settings)
+    else:
+        get_band = lambda start, end: PackImageChannels(sources, size, start, end, dtype)
+        data = EncodeImageBands(get_band, size, band_rows, encode_settings)
+
+    if file_path is not None:
+        with open(file_path, 'wb') as image_file:
+            image_file.write(data)
+
+    return data
+
+
+class PixelCache():
+    """
+    Holds the pixels of source images decoded during a single packing run, so images
+    shared between channels and bundles (like ORM textures or a common AO map) are
+    only read once.  The least recently used images are evicted once the memory
+    limit is reached.
+    """
+
+    def __init__(self, memory_limit):
+        # The memory limit is given in megabytes.
+        self.memory_limit = memory_limit * 1024 * 1024
+        self.memory_used = 0
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+        # Pixels that can't be evicted until release() is called.
+        self.held = None
+
+    def get_key(self, image, dtype):
+        # Include the file and edit state so a reloaded or painted image isn't reused.
+        return (image.name_full, image.filepath, image.is_dirty, np.dtype(dtype).name)
+
+    def get(self, image, dtype = np.float32, size = None, filter_type = 'BILINEAR'):
+        key = self.get_key(image, dtype)
+
+        # Resampled pixels are cached separately, as a source can be used by bundles
+        # with different resolutions.
+        if size is not None and tuple(image.size) != tuple(size):
+            read = lambda: ResampleImagePixels(self.get(image, dtype), size, filter_type)
+            return self.get_entry(key + (tuple(size), filter_type), read)
+
+        return self.get_entry(key, lambda: ReadImagePixels(image, dtype))
+
+    def get_channel(self, image, channel, dtype = np.float32, size = None, filter_type = 'BILINEAR'):
+        # Used by tiled packing, where only the channel being packed is kept.
+        key = self.get_key(image, dtype) + (channel,)
+
+        if size is not None and tuple(image.size) != tuple(size):
+            read = lambda: ResampleImagePixels(self.get_channel(image, channel, dtype), 
+                                               size, filter_type)
+            return self.get_entry(key + (tuple(size), filter_type), read)
+
+        return self.get_entry(key, lambda: ReadImageChannel(image, channel, dtype))
+
+    def get_entry(self, key, read):
+
+        if self.held is not None and key in self.held:
+            self.hits += 1
+            return self.held[key]
+
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            if self.held is not None:
+                self.held[key] = self.entries[key]
+            return self.entries[key]
+        
+        self.misses += 1
+        pixels = read()
+
+        if self.held is not None:
+            self.held[key] = pixels
+
+        # Images larger than the whole cache are just passed through.
+        if pixels.nbytes > self.memory_limit:
+            return pixels
+        
+        self.entries[key] = pixels
+        self.memory_used += pixels.nbytes
+
+        while self.memory_used > self.memory_limit:
+            _, evicted = self.entries.popitem(last = False)
+            self.memory_used -= evicted.nbytes
+
+        return pixels
+
+    def hold(self):
+        """
+        Keeps every image read from now on until release() is called, even if it's larger
+        than the memory limit.  Used so all the outputs for a bundle share one read of
+        each source.
+        """
+        self.held = {}
+
+    def release(self):
+        self.held = None
+
+    def clear(self):
+        self.entries.clear()
+        self.held = None
+        self.memory_used = 0
@@ -1,4 +1,5 @@
 import bpy
+from .bundle_index import selection_cache
 
 class PAK_UL_TextureList(bpy.types.UIList):
 
@@ -299,7 +300,7 @@ def PAK_UI_CreateSelectionHeader(layout, file_data):
     sel_name = 'No Selected Images'
     sel_list = []
     if file_data.enable_multiselect is True:
-        sel_list = [item for item in file_data.bundles if item.is_selected]
+        sel_list = selection_cache.get(file_data.bundles)
         
         if file_data.enable_bundles:
             if len(sel_list) > 1 or len(sel_list) == 0:
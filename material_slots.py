@@ -1,48 +1,125 @@
 import bpy, os, re
+from collections import OrderedDict
 from bpy.types import Panel, Operator, UIList
 from bpy.props import EnumProperty
 
 from .main_menu import PAK_UI_CreatePakData
 
 
+# Compiled slot name matchers, keyed by the slot names and case sensitivity they
+# were made from.  The ones made from the preferences are only rebuilt after the
+# material slot names change (see InvalidateSlotMatchers).
+slot_matchers = {}
+
+# The results of MatchMaterialSlot for recently matched names, least recently used
+# first.  Each name holds the results for every slot list and case mode it was
+# matched with.  Everything is forgotten when the material slot names change.
+slot_matches = OrderedDict()
+
+# The most names slot_matches will remember.
+SLOT_MATCH_CACHE_LIMIT = 50000
+
+
 def GetMaterialSlotStrings(addon_prefs):
     return [t.text for t in addon_prefs.material_slot_names]
 
-# This ensures the search is done in a way that ignores cases.
-def FindMaterialSlotInName(addon_prefs, filename, custom_slots = None, case_sensitive = False):
+def InvalidateSlotMatchers():
+    slot_matchers.clear()
+    slot_matches.clear()
+
+def CompileSlotMatcher(slots, case_sensitive):
+    """
+    Compiles a list of slot names into one regex that finds them in a single pass.
+    Returns the regex and the list position of the slot each of it's groups matches
+    (see MatchMaterialSlot).
+    """
+
+    # Slots earlier in the list take priority, so their positions have to be kept.
+    slots = list(dict.fromkeys(slot for slot in slots if slot != ""))
+    if len(slots) == 0:
+        return None
+    
+    # Longer names are tried first, so where two slots start at the same place the
+    # longer one wins and "Spec" can never match part of "Specular".
+    priorities = sorted(range(len(slots)), key = lambda i: len(slots[i]), reverse = True)
+    pattern = "|".join("(" + re.escape(slots[i]) + ")" for i in priorities)
+
+    # A lookahead finds a slot at every position, even when they overlap.
+    # Case sensitive matching only looks at the end of the name.
+    if case_sensitive is True:
+        return re.compile("(?=(?:" + pattern + ")$)"), priorities
+
+    return re.compile("(?=" + pattern + ")", re.IGNORECASE), priorities
 
-    result = None
-    slots = None
+def GetSlotMatcher(addon_prefs, custom_slots, case_sensitive):
     if custom_slots is None:
-        slots = GetMaterialSlotStrings(addon_prefs)
+        key = (None, case_sensitive)
     else:
+        key = (tuple(custom_slots), case_sensitive)
+    
+    if key not in slot_matchers:
         slots = custom_slots
-
-    # print(filename)
-    # print(slots)
-
-    filename = os.path.splitext(filename)[0]
-    file_data = bpy.data.objects[addon_prefs.pak_filedata_name].PAK_FileData
-
-    if file_data.case_sensitive_matching is True:
-        result = next(filter(filename.endswith, slots), None)    
-
+        if slots is None:
+            slots = GetMaterialSlotStrings(addon_prefs)
+        slot_matchers[key] = CompileSlotMatcher(slots, case_sensitive)
+    
+    return slot_matchers[key]
+
+def ForgetSlotMatches(names):
+    """
+    Forgets the matches for the given names, used when images are renamed or removed.
+    """
+    for name in names:
+        slot_matches.pop(name, None)
+        slot_matches.pop(os.path.splitext(name)[0], None)
+
+def MatchMaterialSlot(addon_prefs, filename, custom_slots = None, case_sensitive = False):
+    """
+    Returns the material slot name found in the filename (see FindMaterialSlotInName)
+    and the filename with it removed.  Results are remembered until the slot names change.
+    """
+
+    slots_key = None
+    if custom_slots is not None:
+        slots_key = tuple(custom_slots)
+    key = (slots_key, case_sensitive)
+
+    name_matches = slot_matches.get(filename)
+    if name_matches is not None:
+        slot_matches.move_to_end(filename)
+        if key in name_matches:
+            return name_matches[key]
     else:
-        for slot in slots:
-
-            if slot in filename:
-                result = slot
-                return result
-            
-            # doesn't return the string area from the original
-            if not case_sensitive:
-                pos = filename.casefold().find(slot.casefold())
-                if pos != -1:
-                    result = filename[pos:]
-                    return result
-
+        name_matches = {}
+        slot_matches[filename] = name_matches
+        if len(slot_matches) > SLOT_MATCH_CACHE_LIMIT:
+            slot_matches.popitem(last = False)
+    
+    result = (None, filename)
+    matcher = GetSlotMatcher(addon_prefs, custom_slots, case_sensitive)
+    if matcher is not None:
+        # The slot earliest in the list wins, then the match nearest the start.
+        regex, priorities = matcher
+        matches = regex.finditer(os.path.splitext(filename)[0])
+        match = min(matches, key = lambda m: priorities[m.lastindex - 1], default = None)
+        if match is not None:
+            slot = match.group(match.lastindex)
+            result = (slot, filename.replace(slot, ""))
+
+    name_matches[key] = result
     return result
 
+# This ensures the search is done in a way that ignores cases.
+def FindMaterialSlotInName(addon_prefs, filename, custom_slots = None, case_sensitive = False):
+    """
+    Returns the material slot name found in the filename, as it's written in the filename,
+    or None if it doesn't have one.  If more than one could match, the one earliest in the
+    slot list wins, then the one nearest the start.  Where two slots start at the same
+    place (like "Spec" and "Specular") the longer one is used.
+    """
+
+    return MatchMaterialSlot(addon_prefs, filename, custom_slots, case_sensitive)[0]
+
 
 class PAK_OT_AddMaterialSlotName(Operator):
     """Add a material slot name to the list"""
@@ -59,6 +136,7 @@ class PAK_OT_AddMaterialSlotName(Operator):
 
         new_string = addon_prefs.material_slot_names.add()
         new_string.text = "MaterialSlot" + str(len(addon_prefs.material_slot_names))
+        InvalidateSlotMatchers()
 
         return {'FINISHED'}
     
@@ -80,6 +158,7 @@ class PAK_OT_DeleteMaterialSlot(Operator):
 
         # Once everything has been set, remove it.
         addon_prefs.material_slot_names.remove(sel_index)
+        InvalidateSlotMatchers()
 
         # ensure the selected list index is within the list bounds
         if len(addon_prefs.material_slot_names) > 0 and sel_index != 0:
@@ -134,6 +213,9 @@ class PAK_OT_MoveMaterialSlot(Operator):
         slots.move(neighbor, index)
         self.move_index(addon_prefs)
 
+        # The order decides which slot wins when more than one matches.
+        InvalidateSlotMatchers()
+
         return{'FINISHED'}
 
 
@@ -246,3 +328,5 @@ def CreateDefaultMaterialSlotNames():
     new_string = addon_prefs.material_slot_names.add()
     new_string.text = "Displacement"
 
+    InvalidateSlotMatchers()
+
@@ -1,9 +1,12 @@
 
-import bpy, platform, os
+import bpy, platform, os, time
 
 from bpy.types import Operator
-from .material_slots import FindMaterialSlotInName, CreateDefaultMaterialSlotNames
+from .material_slots import (
+    MatchMaterialSlot, CreateDefaultMaterialSlotNames, InvalidateSlotMatchers
+)
 from .main_menu import CreatePakPreviewTexture
+from .bundle_index import bundle_index, selection_cache
 
 def Find3DViewContext():
     """
@@ -76,6 +79,7 @@ class PAK_OT_CreateFileData(Operator):
             pak_data_obj.hide_render = True
             pak_data_obj.hide_select = True
             pak_data_obj.PAK_FileData.is_file_data = True
+            RefreshBundles(addon_prefs, pak_data_obj.PAK_FileData)
 
             context.view_layer.objects.active = prev_active_object
             for obj in prev_selected_objects:
@@ -126,6 +130,10 @@ class PAK_OT_Bundles_Toggle(Operator):
     bl_idname = "pak.toggle_bundles"
     bl_label = "Toggle Bundles"
 
+    @classmethod
+    def poll(cls, context):
+        return len(RUNS_IN_PROGRESS) == 0
+
     def execute(self, context):
         
         try:
@@ -138,87 +146,130 @@ class PAK_OT_Bundles_Toggle(Operator):
         return {'FINISHED'}
     
 
-class PAK_OT_Refresh(Operator):
-    """Refresh the list of textures used in the current scene.  You'll need to do this every time images are loaded or deleted outside of PakPal"""
+def GetBundleGroups(addon_prefs, file_data):
+    """
+    Returns a list of (bundle name, images) for every bundle the image list should have.
+    """
 
-    bl_idname = "pak.refresh_images"
-    bl_label = "Refresh List"
+    groups = {}
 
-    def execute(self, context):
+    for tex in bpy.data.images:
+
+        if tex.name.startswith(".") and file_data.show_hidden is False:
+            continue
+
+        if file_data.enable_bundles is False:
+            groups[tex.name] = [tex]
+            continue
         
-        try:
-            addon_prefs = context.preferences.addons[__package__].preferences
-            file_data = bpy.data.objects[addon_prefs.pak_filedata_name].PAK_FileData
-        except:
-            return {'CANCELLED'}
+        filename = os.path.splitext(tex.name)[0]
+        match, filename = MatchMaterialSlot(addon_prefs, filename, None,
+                                            file_data.case_sensitive_matching)
         
-        file_data.is_internal_update = True
+        if filename not in groups:
+            groups[filename] = []
+        groups[filename].append(tex)
+    
+    # Bundles with a single image just use the image name.
+    return [(textures[0].name if len(textures) == 1 else name, textures) 
+            for name, textures in groups.items()]
 
-        bundles = file_data.bundles
-        bundles.clear()
+def SetBundleImages(bundle, textures):
+    bundle.pak_items.clear()
+    for tex in textures:
+        bundle_item = bundle.pak_items.add()
+        bundle_item.tex = tex
 
-        if file_data.enable_bundles is False:
-            
-            for tex in bpy.data.images:
+def AddBundle(bundles, name, textures):
+    bundle = bundles.add()
+    bundle.name = name
+    bundle.enable_export = textures[0].PAK_Img.enable_export
 
-                if tex.name.startswith(".") and file_data.show_hidden is False:
-                    continue
+    #workaround for a strange enum assignment issue
+    if textures[0].PAK_Img.export_location != "": 
+        bundle.export_location = textures[0].PAK_Img.export_location
 
-                bundle = bundles.add()
-                bundle.name = tex.name
-                bundle.enable_export = tex.PAK_Img.enable_export
-                
-                #workaround for a strange assignment issue
-                if tex.PAK_Img.export_location != "": 
-                    bundle.export_location = tex.PAK_Img.export_location
+    SetBundleImages(bundle, textures)
 
-                bundle_item = bundle.pak_items.add()
-                bundle_item.tex = tex
+def RefreshBundles(addon_prefs, file_data):
+    """
+    Updates the image list to match the images in the file, only adding, removing or
+    regrouping the bundles that changed.  Returns the number of bundles changed.
+    """
 
-        else:
-            bundle_dict = {}
+    file_data.is_internal_update = True
 
-            for tex in bpy.data.images:
-                
-                if tex.name.startswith(".") and file_data.show_hidden is False:
-                    continue
-                
-                name_parts = [n for n in os.path.splitext(tex.name)]
-                filename = name_parts.pop(0)
-                extension = ""
-                for text in name_parts:
-                    extension += text
+    bundles = file_data.bundles
+    groups = GetBundleGroups(addon_prefs, file_data)
+    group_images = dict(groups)
+    changes = 0
 
-                match = FindMaterialSlotInName(addon_prefs, filename, None,
-                                               file_data.case_sensitive_matching)
+    # Bundles are matched by name, so if two end up sharing one just start again.
+    if len(group_images) != len(groups):
+        bundles.clear()
+        for name, textures in groups:
+            AddBundle(bundles, name, textures)
+        changes = len(groups)
 
-                if match:
-                    filename = filename.replace(match, "")
-                
-                if filename not in bundle_dict:
-                    bundle_dict[filename] = []
-                bundle_dict[filename].append(tex)
-
-            for i, (name, textures) in enumerate(bundle_dict.items()):
-
-                bundle = bundles.add()
-                if len(textures) == 1:
-                    bundle.name = textures[0].name
-                else:
-                    bundle.name = name
-                bundle.enable_export = textures[0].PAK_Img.enable_export
-
-                #workaround for a strange enum assignment issue
-                if textures[0].PAK_Img.export_location != "": 
-                    bundle.export_location = textures[0].PAK_Img.export_location
-                
-                for tex in textures:
-                    bundle_item = bundle.pak_items.add()
-                    bundle_item.tex = tex
-                
-        if len(file_data.bundles) <= (file_data.bundles_list_index - 1):
-            file_data.bundles_list_index = len(file_data.bundles) - 1
-        file_data.is_internal_update = False
+    else:
+        # Remove from the end, so the indexes left to remove don't move.
+        seen_names = set()
+        removed = []
+        for i, bundle in enumerate(bundles):
+            if bundle.name not in group_images or bundle.name in seen_names:
+                removed.append(i)
+            seen_names.add(bundle.name)
+
+        for i in reversed(removed):
+            bundles.remove(i)
+        changes += len(removed)
+
+        # Bundles that stay keep their selection and export settings.
+        existing_names = set()
+        for bundle in bundles:
+            existing_names.add(bundle.name)
+            textures = group_images[bundle.name]
+            if [item.tex for item in bundle.pak_items] != textures:
+                SetBundleImages(bundle, textures)
+                changes += 1
+
+        # New bundles are moved to where a full rebuild would have put them.
+        for i, (name, textures) in enumerate(groups):
+            if name in existing_names:
+                continue
+
+            AddBundle(bundles, name, textures)
+            bundles.move(len(bundles) - 1, i)
+            changes += 1
+    
+    if len(file_data.bundles) <= (file_data.bundles_list_index - 1):
+        file_data.bundles_list_index = len(file_data.bundles) - 1
+    file_data.is_internal_update = False
+
+    bundle_index.rebuild(file_data.bundles)
+    selection_cache.invalidate()
+    return changes
+
+
+class PAK_OT_Refresh(Operator):
+    """Refresh the list of textures used in the current scene.  The list updates itself when images are added, renamed or removed, so this is only needed if it ever falls out of sync"""
+
+    bl_idname = "pak.refresh_images"
+    bl_label = "Refresh List"
+
+    @classmethod
+    def poll(cls, context):
+        return len(RUNS_IN_PROGRESS) == 0
+
+    def execute(self, context):
+        
+        try:
+            addon_prefs = context.preferences.addons[__package__].preferences
+            file_data = bpy.data.objects[addon_prefs.pak_filedata_name].PAK_FileData
+        except:
+            return {'CANCELLED'}
+        
+        RefreshBundles(addon_prefs, file_data)
         
         return {'FINISHED'}
 
@@ -236,7 +287,7 @@ class PAK_OT_Delete_Images(Operator):
         try:
             addon_prefs = context.preferences.addons[__package__].preferences
             file_data = bpy.data.objects[addon_prefs.pak_filedata_name].PAK_FileData
-            return GetSelectionCount(file_data)
+            return len(RUNS_IN_PROGRESS) == 0 and GetSelectionCount(file_data)
         except:
             return False
         # return True
@@ -261,34 +312,24 @@ class PAK_OT_Delete_Images(Operator):
                             for bundle in selected_bundles]
         selected_images = set(i for j in selected_images for i in j)
 
+        # Removing a bundle moves every bundle after it, so they're removed from the 
+        # end and the indexes are worked out before anything is removed.
+        selected_names = [bundle.name for bundle in selected_bundles]
+        removed = sorted(bundle_index.find(file_data.bundles, name) for name in selected_names)
+        removed = [i for i in removed if i != -1]
+
         # Used to decrease the selected bundle.
-        index_subtract = 0
-        
-        ## BUG - Removing by index doesn't appear to properly work, the items removed
-        ## be at random rather than the correct index, I can't find a replicatable pattern.
-        ##
-        ## The bundle list will be regenerated instead.
-
-        # for bundle in selected_bundles:
-        #     for bundle in selected_bundles:
-        #         print(file_data.bundles.find(bundle.name))
-        #     print('-'*10)
-            
-        #     index = file_data.bundles.find(bundle.name)
-        #     file_data.bundles.remove(index - index_subtract)
-
-        #     if index <= file_data.bundles_list_index:
-        #         index_subtract += 1
-        
-        # return {'FINISHED'}
+        index_subtract = len([i for i in removed if i < file_data.bundles_list_index])
+
+        for i in reversed(removed):
+            file_data.bundles.remove(i)
 
         # Now purge the data
         bpy.data.batch_remove([image for image in selected_images if image is not None])
         self.report({'INFO'}, str(image_count) + " image(s) were deleted.")
 
-        # TODO - Get the original solution working again to prevent potential slowdown in
-        # large projects.
-        bpy.ops.pak.refresh_images()
+        bundle_index.rebuild(file_data.bundles)
+        selection_cache.invalidate()
 
         # Decrement the index unless it would be less than zero
         file_data.bundles_list_index = max(0, (file_data.bundles_list_index - index_subtract))
@@ -337,6 +378,10 @@ class PAK_OT_Reset_Properties(Operator):
     bl_idname = "pak.reset_properties"
     bl_label = "Reset Main Properties"
 
+    @classmethod
+    def poll(cls, context):
+        return len(RUNS_IN_PROGRESS) == 0
+
     def execute(self, context):
 
         try:
@@ -363,6 +408,11 @@ class PAK_OT_Reset_Properties(Operator):
         CreateDefaultMaterialSlotNames()
         CreatePakPreviewTexture()
 
+        # Nothing cached about the old list or slot names applies anymore.
+        bundle_index.rebuild(file_data.bundles)
+        selection_cache.invalidate()
+        InvalidateSlotMatchers()
+
         return {'FINISHED'}
 
     def invoke(self, context, event):
@@ -384,22 +434,154 @@ class PAK_OT_Reset_Properties(Operator):
         
         return {'FINISHED'}
 
+
+# The results of the last export and image pack, so scripts (like cli.py) can read
+# them after running the operators.
+LAST_RUN_INFO = {}
+
+# The operators currently running (see PAK_ModalProgress).  Exports and packs hold
+# onto bundles while they run, so the image list can't be rebuilt until they finish.
+RUNS_IN_PROGRESS = set()
+
+
+class PAK_ModalProgress():
+    """
+    Lets an operator run it's work in small time slices from a timer, showing progress
+    in the status bar and stopping when ESC is pressed.  The interface stays usable 
+    while it runs.
+
+    Operators using this provide run(context), a generator that yields after every
+    step and keeps progress_done, progress_total and progress_bytes up to date.  
+    Cleanup should be in a finally block, as cancelling closes the generator.
+    When called from a script, execute() runs everything at once.
+    """
+
+    progress_label = "PakPal"
+    progress_unit = "images"
+
+    # How long each timer event can spend working before the interface gets a turn.
+    time_slice = 0.05
+
+    @classmethod
+    def poll(cls, context):
+        # Runs share the image list and the export journal, so only one can go at a time.
+        return len(RUNS_IN_PROGRESS) == 0
+
+    def reset_progress(self):
+        self.progress_done = 0
+        self.progress_total = 0
+        self.progress_bytes = 0
+        self.progress_start_time = time.perf_counter()
+
+    def get_progress_text(self):
+        elapsed = max(time.perf_counter() - self.progress_start_time, 0.001)
+        info = (self.progress_label + ": " + str(self.progress_done) + " / " 
+                + str(self.progress_total) + " " + self.progress_unit)
+        
+        info += "  |  {:.1f} {}/s, {:.1f} MB/s".format(self.progress_done / elapsed, 
+                                                     self.progress_unit, 
+                                                     self.progress_bytes / elapsed / 1000000)
+
+        if self.progress_done > 0 and self.progress_total > self.progress_done:
+            remaining = (self.progress_total - self.progress_done) * elapsed / self.progress_done
+            info += "  |  {:d}s remaining".format(int(remaining))
+        
+        return info + "  |  ESC to cancel"
+
+    def execute(self, context):
+        self.reset_progress()
+        RUNS_IN_PROGRESS.add(self.bl_idname)
+        try:
+            for _ in self.run(context):
+                pass
+        finally:
+            RUNS_IN_PROGRESS.discard(self.bl_idname)
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        self.reset_progress()
+        self.steps = self.run(context)
+        RUNS_IN_PROGRESS.add(self.bl_idname)
+
+        window_manager = context.window_manager
+        self.timer = window_manager.event_timer_add(0.01, window = context.window)
+        window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def finish_modal(self, context):
+        RUNS_IN_PROGRESS.discard(self.bl_idname)
+        context.window_manager.event_timer_remove(self.timer)
+        if context.workspace is not None:
+            context.workspace.status_text_set(None)
+
+    def cancel(self, context):
+        # Called instead of modal() when the handler is removed by Blender, like when
+        # a file is opened or the window is closed.
+        self.steps.close()
+        self.finish_modal(context)
+
+    def modal(self, context, event):
+
+        if event.type == 'ESC':
+            self.steps.close()
+            self.finish_modal(context)
+            self.report({'WARNING'}, self.progress_label + " cancelled after " 
+                        + str(self.progress_done) + " of " + str(self.progress_total) 
+                        + " " + self.progress_unit + ".")
+            return {'CANCELLED'}
+        
+        # Undo and redo swap out the image list and everything in it, so they have
+        # to wait until the run is finished.
+        if event.type in {'Z', 'Y'} and (event.ctrl or event.oskey):
+            return {'RUNNING_MODAL'}
+
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+        
+        slice_end = time.perf_counter() + self.time_slice
+        try:
+            while time.perf_counter() < slice_end:
+                next(self.steps)
+        
+        except StopIteration:
+            self.finish_modal(context)
+            return {'FINISHED'}
+        
+        except:
+            self.steps.close()
+            self.finish_modal(context)
+            raise
+
+        context.workspace.status_text_set(self.get_progress_text())
+        return {'PASS_THROUGH'}
+
+
+def RecordThroughput(file_data, property_name, seconds, pixel_count):
+    # Stores how many seconds each megapixel took to process, averaged over past runs
+    # so a single slow or fast run doesn't throw off future estimates.
+    if pixel_count <= 0:
+        return
+    
+    measured = seconds / (pixel_count / 1000000)
+    previous = getattr(file_data, property_name)
+
+    if previous > 0:
+        measured = (previous * 0.7) + (measured * 0.3)
+    
+    setattr(file_data, property_name, measured)
+
 def GetSelection(file_data):
     # Used to return the bundles selected.
     if file_data.enable_multiselect is True:
-        return [bundle for bundle in file_data.bundles 
-                if bundle.is_selected]
+        return selection_cache.get_bundles(file_data.bundles)
     else:
         return [file_data.bundles[file_data.bundles_list_index]]
 
 def GetSelectionCount(file_data):
-    # Used to return the number of selected bundles.
-    i = 0
+    # Used to return the number of selected images.
     if file_data.enable_multiselect is True:
-        bundle_list = [bundle.pak_items for bundle in file_data.bundles 
-                        if bundle.is_selected]
-        selected_images = set(i for j in bundle_list for i in j)
-        return len(selected_images)
+        selection_cache.get(file_data.bundles)
+        return selection_cache.image_count
 
     elif len(file_data.bundles) > 0:
         return len(file_data.bundles[file_data.bundles_list_index].pak_items)
@@ -0,0 +1,165 @@
+import bpy
+
+# //////////////////////////////////////////////////////////////
+# //////////////////////////////////////////////////////////////
+# PIPELINE SCENE
+#
+# Exports and image packs are rendered and saved through a hidden scene that's
+# stored in PAK_FileData.scene_data.  The compositor graphs they use are built
+# once, and each export or pack just swaps the images and settings on the nodes
+# that already exist.
+#
+# https://blender.stackexchange.com/questions/19500/controling-compositor-by-python
+# https://docs.blender.org/api/current/bpy.types.CompositorNode.html
+
+PIPELINE_SCENE_NAME = ".PakPal Pipeline"
+
+PACK_CHANNELS = ('R', 'G', 'B', 'A')
+CHANNEL_SLOTS = {'R': 0, 'G': 1, 'B': 2, 'A': 3}
+
+# Every node the pipeline needs, if any are missing the graph gets rebuilt.
+PIPELINE_NODES = (
+    ["Export Image", "Export Viewer", "Pack Combine", "Pack Viewer"]
+    + ["Pack Image " + c for c in PACK_CHANNELS]
+    + ["Pack Invert " + c for c in PACK_CHANNELS]
+    + ["Pack Separate " + c for c in PACK_CHANNELS]
+)
+
+
+def CreatePipelineNodes(scene):
+    """
+    Builds the export and image pack node graphs in the pipeline scene.
+    """
+
+    scene.use_nodes = True
+    tree = scene.node_tree
+    links = tree.links
+
+    # clear default nodes
+    for node in tree.nodes:
+        tree.nodes.remove(node)
+
+    # EXPORT GRAPH
+    export_image = tree.nodes.new(type = 'CompositorNodeImage')
+    export_image.name = "Export Image"
+    export_image.location = 0, 400
+
+    export_viewer = tree.nodes.new(type = 'CompositorNodeViewer')
+    export_viewer.name = "Export Viewer"
+    export_viewer.location = 300, 400
+
+    links.new(export_image.outputs[0], export_viewer.inputs[0])
+
+    # PACK GRAPH
+    # NOTE: Image color output includes the alpha channel
+    combine_color = tree.nodes.new(type = 'CompositorNodeCombineColor')
+    combine_color.name = "Pack Combine"
+    combine_color.mode = 'RGB'
+    combine_color.location = 750, -550
+
+    for i, channel in enumerate(PACK_CHANNELS):
+        image_node = tree.nodes.new(type = 'CompositorNodeImage')
+        image_node.name = "Pack Image " + channel
+        image_node.location = 0, -350 * i
+
+        invert = tree.nodes.new(type = 'CompositorNodeInvert')
+        invert.name = "Pack Invert " + channel
+        invert.location = 250, -350 * i
+        invert.invert_alpha = True
+
+        separate = tree.nodes.new(type = 'CompositorNodeSeparateColor')
+        separate.name = "Pack Separate " + channel
+        separate.mode = 'RGB'
+        separate.location = 500, -350 * i
+
+        links.new(image_node.outputs[0], invert.inputs[1])
+        links.new(invert.outputs[0], separate.inputs[0])
+
+    pack_viewer = tree.nodes.new(type = 'CompositorNodeViewer')
+    pack_viewer.name = "Pack Viewer"
+    pack_viewer.location = 1000, -550
+
+    links.new(combine_color.outputs[0], pack_viewer.inputs[0])
+
+def IsPipelineSceneValid(scene):
+    if scene is None or scene.name not in bpy.data.scenes:
+        return False
+
+    if scene.use_nodes is False or scene.node_tree is None:
+        return False
+
+    return all(name in scene.node_tree.nodes for name in PIPELINE_NODES)
+
+def GetPipelineScene(file_data):
+    """
+    Returns the pipeline scene, creating it (or repairing it's nodes) if needed.
+    """
+
+    scene = file_data.scene_data
+    if IsPipelineSceneValid(scene):
+        return scene
+
+    if scene is None or scene.name not in bpy.data.scenes:
+        scene = bpy.data.scenes.new(PIPELINE_SCENE_NAME)
+        scene.use_fake_user = True
+        file_data.scene_data = scene
+
+    # Set the scene to ensure colors aren't edited
+    scene.render.image_settings.color_management = 'OVERRIDE'
+    scene.view_settings.view_transform = 'Standard'
+    scene.view_settings.look = 'None'
+
+    CreatePipelineNodes(scene)
+    return scene
+
+def SetExportNodes(scene, image):
+    """
+    Sets the image that will be rendered by the export graph.
+    """
+    scene.node_tree.nodes["Export Image"].image = image
+
+def SetPackNodes(scene, sources, channels, inverts):
+    """
+    Sets the images, channels and inverts used by the pack graph.  Each argument is a
+    list of four values, one for each output channel.
+    """
+
+    tree = scene.node_tree
+    combine_color = tree.nodes["Pack Combine"]
+
+    # Any unlinked channel will use the same default as the combine node.
+    for link in list(combine_color.inputs[0].links + combine_color.inputs[1].links
+                     + combine_color.inputs[2].links + combine_color.inputs[3].links):
+        tree.links.remove(link)
+
+    for target, source, channel, invert in zip(PACK_CHANNELS, sources, channels, inverts):
+        tree.nodes["Pack Image " + target].image = source
+        tree.nodes["Pack Invert " + target].inputs['Fac'].default_value = invert
+
+        if source is not None:
+            separate = tree.nodes["Pack Separate " + target]
+            tree.links.new(separate.outputs[CHANNEL_SLOTS[channel]],
+                           combine_color.inputs[CHANNEL_SLOTS[target]])
+
+def ClearPipelineImages(scene):
+    """
+    Removes every image from the pipeline nodes, so the scene doesn't keep them alive.
+    """
+    for node in scene.node_tree.nodes:
+        if node.type == 'IMAGE':
+            node.image = None
+
+def RenderPipelineScene(scene, viewer_name):
+    """
+    Renders one of the pipeline graphs into the Viewer Node image.
+    """
+
+    # Only the active viewer is written to.
+    scene.node_tree.nodes.active = scene.node_tree.nodes[viewer_name]
+
+    # This renders whatever is on the compositor.
+    # When using a File Output node it will forcefully add a frame number to the end.
+    bpy.ops.render.render(animation = False, write_still = False, use_viewport = False,
+                          layer = "", scene = scene.name)
+
+    return bpy.data.images['Viewer Node']
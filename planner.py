@@ -0,0 +1,363 @@
+import bpy, os
+from datetime import datetime
+import numpy as np
+
+from bpy.types import Operator
+from bpy.props import EnumProperty
+
+from .operators import GetSelection
+from .export import GetExportables, CanCopyImageFile
+from .export_locations import ExportPathCache, SubstituteNameCharacters
+from .image_format_properties import GetImageFileExtension, GetImageFormatKey
+from .export_manifest import ExportManifest, GetSourceStat, GetFormatHash
+from .image_pack import (
+    GetPackRecipes,
+    GetPackSources,
+    GetPackFilePath,
+    GetPackFingerprint,
+    IsPackUnchanged,
+)
+from .image_pack_engine import GetPackSize
+from .image_encode import CanEncodeImage, GetEncodeSettings, GetEncodeDtype
+
+# //////////////////////////////////////////////////////////////
+# //////////////////////////////////////////////////////////////
+# RUN PLANNING
+#
+# Works out everything a pack or export would do without doing it, so runs that
+# would use too much memory or take forever can be caught before they start.
+#
+# Memory estimates are width x height x channels x bytes for everything that would
+# be held at once, and are meant as an upper bound.  Time estimates use the
+# seconds per megapixel measured from previous runs.
+
+# The number of outputs shown in the popup, the full plan is printed to the console.
+PLAN_DISPLAY_LIMIT = 20
+
+
+def GetImageBufferSize(image):
+    # Blender stores byte images as 4 bytes per pixel and float images as 16, and
+    # keeps them loaded after they've been read.
+    bytes_per_pixel = 16 if image.is_float else 4
+    return image.size[0] * image.size[1] * bytes_per_pixel
+
+def GetSystemMemory():
+    # Not every platform can report this, in which case it's not checked.
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, AttributeError, OSError):
+        return None
+
+def FormatBytes(byte_count):
+    if byte_count >= 1024 ** 3:
+        return "{:.2f} GB".format(byte_count / (1024 ** 3))
+    return "{:.1f} MB".format(byte_count / (1024 ** 2))
+
+def FormatTime(seconds):
+    if seconds >= 3600:
+        return "{:d}h {:d}m".format(int(seconds // 3600), int(seconds % 3600) // 60)
+    if seconds >= 60:
+        return "{:d}m {:d}s".format(int(seconds // 60), int(seconds % 60))
+    return "{:.1f}s".format(seconds)
+
+def CreatePlan():
+    return {
+        'outputs': [],
+        'sources': set(),
+        'megapixels': 0.0,
+        'peak_memory': 0,
+        'seconds_per_megapixel': 0.0,
+        'skipped': {},
+    }
+
+def PlanImagePack(addon_prefs, file_data):
+    """
+    Returns a plan of every image the image packer would make for the current selection.
+    """
+    plan = CreatePlan()
+    plan['seconds_per_megapixel'] = file_data.pack_seconds_per_megapixel
+    plan['skipped'] = {'unchanged': 0, 'not_found': 0, 'not_overwritten': 0}
+
+    use_compositor = file_data.pack_engine == 'COMPOSITOR'
+    source_fingerprints = {}
+
+    blender_buffers = {}
+    cache_entries = {}
+    largest_bundle = 0
+    largest_job = 0
+    largest_output = 0
+    pipeline_jobs = 0
+
+    for bundle in GetSelection(file_data):
+        bundle_entries = {}
+
+        for pack_settings in GetPackRecipes(file_data):
+            # Planning shouldn't leave empty folders behind.
+            file_name, file_path = GetPackFilePath(file_data, bundle, pack_settings, 
+                                                   create_directory = False)
+
+            if file_name in bpy.data.images and file_data.overwrite_image_pack is False:
+                plan['skipped']['not_overwritten'] += 1
+                continue
+
+            sources = GetPackSources(addon_prefs, file_data, bundle, pack_settings)
+            used_sources = [s for s in sources if s is not None]
+            if len(used_sources) == 0:
+                plan['skipped']['not_found'] += 1
+                continue
+
+            fingerprint = GetPackFingerprint(file_data, pack_settings, sources,
+                                             source_fingerprints)
+            if IsPackUnchanged(file_data, file_name, file_path, fingerprint):
+                plan['skipped']['unchanged'] += 1
+                continue
+
+            source_sizes = set(tuple(s.size) for s in used_sources)
+            size = GetPackSize(source_sizes, file_data.pack_resolution_policy,
+                               file_data.pack_resolution)
+            pixel_count = size[0] * size[1]
+
+            plan['outputs'].append({
+                'name': file_name,
+                'path': file_path,
+                'size': size,
+                'sources': [s.name for s in used_sources],
+            })
+            plan['sources'].update(s.name for s in used_sources)
+            plan['megapixels'] += pixel_count / 1000000
+
+            for source in used_sources:
+                blender_buffers[source.name] = GetImageBufferSize(source)
+
+            # The compositor renders everything as floats inside Blender.
+            if use_compositor:
+                largest_output = max(largest_output, pixel_count * 16 * 2)
+                continue
+
+            can_encode = CanEncodeImage(pack_settings.pack_format.file_format)
+            dtype = np.float32
+            if can_encode:
+                dtype = GetEncodeDtype(GetEncodeSettings(pack_settings.pack_format))
+            item_size = np.dtype(dtype).itemsize
+
+            # Work out what the pixel cache will hold, including resampled copies.
+            use_tiles = file_data.pack_tiled and can_encode
+            channels = 1 if use_tiles else 4
+            for source in used_sources:
+                key = (source.name, np.dtype(dtype).name)
+                entry_size = source.size[0] * source.size[1] * channels * item_size
+                if tuple(source.size) != tuple(size):
+                    entry_size += pixel_count * channels * item_size
+
+                cache_entries[key] = entry_size
+                bundle_entries[key] = entry_size
+
+            if can_encode:
+                pipeline_jobs += 1
+                job_size = pixel_count * 4 * item_size * 3
+                if use_tiles:
+                    job_size = min(job_size, file_data.pack_tile_memory * 1024 * 1024)
+                largest_job = max(largest_job, job_size)
+
+            else:
+                # Packed as floats, then copied into a Blender image to be saved.
+                largest_output = max(largest_output, pixel_count * 16 * 2)
+
+        largest_bundle = max(largest_bundle, sum(bundle_entries.values()))
+
+    # Every source for a bundle is held until it's done, even past the cache limit.
+    cache_limit = file_data.pack_cache_limit * 1024 * 1024
+    cache_total = sum(cache_entries.values())
+    cache_memory = max(min(cache_total, cache_limit), largest_bundle)
+
+    # Tiled packing doesn't hold sources, but the jobs waiting to be packed keep theirs
+    # until they're done, up to the cache limit or a single bundle's worth.
+    if file_data.pack_tiled:
+        cache_memory = min(cache_total, cache_limit) + min(max(cache_limit, largest_bundle), 
+                                                           cache_total)
+
+    # Finished images can pile up until the pipeline waits on them.
+    jobs_in_flight = min(pipeline_jobs, (file_data.pack_worker_count * 2) + 1)
+    working_memory = max(largest_job * jobs_in_flight, largest_output)
+
+    plan['peak_memory'] = sum(blender_buffers.values()) + cache_memory + working_memory
+    return plan
+
+def PlanExport(file_data, set_mode):
+    """
+    Returns a plan of every image that would be exported with the given export mode.
+    """
+    plan = CreatePlan()
+    plan['seconds_per_megapixel'] = file_data.export_seconds_per_megapixel
+
+    exportable, no_export_location = GetExportables(file_data, set_mode)
+    plan['skipped'] = {'no_export_location': no_export_location, 'unchanged': 0}
+    manifests = {}
+
+    blender_buffers = 0
+    largest_output = 0
+
+    # Planning shouldn't leave empty folders behind.
+    export_paths = ExportPathCache(file_data, datetime.now(), create_directories = False)
+
+    for export_item in exportable:
+        image = export_item['image']
+
+        location_index = int(export_item['export_location']) - 1
+        path = export_paths.get_path(location_index, export_item['bundle'])
+        format_index = int(export_item['export_format']) - 1
+
+        filename = SubstituteNameCharacters(image.name)
+        filename = filename.rsplit( ".", 1 )[ 0 ]
+
+        export_format = None
+        if format_index != -1:
+            export_format = file_data.formats[format_index]
+            file_format = export_format.file_format
+            format_hash = GetFormatHash(GetImageFormatKey(export_format))
+        else:
+            file_format = image.file_format
+            format_hash = GetFormatHash(('ORIGINAL', image.file_format))
+        filename = filename + GetImageFileExtension(file_format)
+
+        # Images that haven't changed since they were last exported are skipped.
+        if path not in manifests:
+            manifests[path] = ExportManifest(path)
+        manifest = manifests[path]
+
+        if file_data.force_export is False and filename in manifest.entries:
+            source_hash = manifest.get_source_hash(filename, image, GetSourceStat(image))
+            if manifest.is_unchanged(filename, path + filename, source_hash, format_hash):
+                plan['skipped']['unchanged'] += 1
+                continue
+
+        plan['outputs'].append({
+            'name': image.name,
+            'path': path + filename,
+            'size': tuple(image.size),
+            'sources': [image.name],
+        })
+        plan['sources'].add(image.name)
+
+        # Copied files don't need decoding, so they don't add to memory or the time estimate.
+        if CanCopyImageFile(image, export_format):
+            plan['outputs'][-1]['sources'] = ["copy of " + image.name]
+            continue
+
+        # Formatted exports are rendered through the compositor as floats.
+        if export_format is not None:
+            largest_output = max(largest_output, image.size[0] * image.size[1] * 16)
+
+        plan['megapixels'] += (image.size[0] * image.size[1]) / 1000000
+        blender_buffers += GetImageBufferSize(image)
+
+    plan['peak_memory'] = blender_buffers + largest_output
+    return plan
+
+def GetPlanSummary(plan):
+    """
+    Returns a list of lines describing the plan.
+    """
+    lines = []
+    lines.append(str(len(plan['outputs'])) + " outputs from " + str(len(plan['sources']))
+                 + " source images (" + "{:.1f}".format(plan['megapixels']) + " megapixels).")
+
+    for reason, count in plan['skipped'].items():
+        if count > 0:
+            lines.append(str(count) + " skipped - " + reason.replace("_", " ") + ".")
+
+    memory_info = "Estimated peak memory: " + FormatBytes(plan['peak_memory'])
+    system_memory = GetSystemMemory()
+    if system_memory is not None:
+        memory_info += " of " + FormatBytes(system_memory)
+    lines.append(memory_info)
+
+    if system_memory is not None and plan['peak_memory'] > system_memory:
+        lines.append("WARNING - This run could use more memory than this system has.")
+
+    if plan['seconds_per_megapixel'] > 0:
+        seconds = plan['megapixels'] * plan['seconds_per_megapixel']
+        lines.append("Estimated time: " + FormatTime(seconds))
+    else:
+        lines.append("Estimated time: Unknown (finish a run first to measure it)")
+
+    return lines
+
+def GetPlanOutputLines(plan):
+    lines = []
+    for output in plan['outputs']:
+        lines.append(output['name'] + "  (" + str(output['size'][0]) + "x" + str(output['size'][1])
+                     + ")  <-  " + ", ".join(output['sources']))
+    return lines
+
+
+class PAK_OT_PlanRun(Operator):
+    """Lists everything that would be written by a pack or export, along with an estimate of how much memory and time it would need.  Nothing is packed or exported"""
+
+    bl_idname = "pak.plan_run"
+    bl_label = "Plan Run"
+
+    plan_mode: EnumProperty(
+        name = "Plan Mode",
+        items = [
+            ('PACK', "Image Pack", "Plan an image pack of the current selection"),
+            ('EXPORT', "Export", "Plan an export"),
+            ],
+        default = 'PACK',
+        options = {'HIDDEN'},
+    )
+
+    set_mode: EnumProperty(
+        name = "Export Mode",
+        items = [
+            ('ALL', "All Active", "Plan an export of all images that have been marked for export"),
+            ('SELECTED', "Selected", "Plan an export of the currently selected images"),
+            ],
+        default = 'ALL',
+        options = {'HIDDEN'},
+    )
+
+    def execute(self, context):
+
+        try:
+            addon_prefs = context.preferences.addons[__package__].preferences
+            file_data = bpy.data.objects[addon_prefs.pak_filedata_name].PAK_FileData
+        except:
+            return {'CANCELLED'}
+
+        if self.plan_mode == 'PACK':
+            if file_data.enable_bundles is False:
+                self.report({'WARNING'}, "Image packing requires Bundles to be enabled.")
+                return {'FINISHED'}
+
+            plan = PlanImagePack(addon_prefs, file_data)
+            title = "Image Pack Plan"
+        else:
+            plan = PlanExport(file_data, self.set_mode)
+            title = "Export Plan"
+
+        summary = GetPlanSummary(plan)
+        output_lines = GetPlanOutputLines(plan)
+
+        # The full plan can be huge, so it goes in the console.
+        print(title)
+        for output, line in zip(plan['outputs'], output_lines):
+            print("  " + line + "  ->  " + output['path'])
+        for line in summary:
+            print(line)
+
+        def plan_layout(self, context):
+            for line in summary:
+                self.layout.label(text = line)
+
+            self.layout.separator()
+            for line in output_lines[:PLAN_DISPLAY_LIMIT]:
+                self.layout.label(text = line)
+
+            if len(output_lines) > PLAN_DISPLAY_LIMIT:
+                self.layout.label(text = "...and " + str(len(output_lines) - PLAN_DISPLAY_LIMIT)
+                                  + " more (see the console for the full plan).")
+
+        context.window_manager.popup_menu(plan_layout, title = title, icon = 'TIME')
+
+        return {'FINISHED'}
@@ -6,6 +6,7 @@ from .image_format_properties import PAK_ImageFormat
 
 from bpy.props import (
     IntProperty, 
+    IntVectorProperty,
     FloatProperty, 
     BoolProperty, 
     StringProperty, 
@@ -74,6 +75,9 @@ class PAK_Image(PropertyGroup):
         description = "Set the export format that will be used when exporting a texture.  This will NOT change the file format of the image as it is currently stored",
         items = GetImageFormats,
     )
+
+    # Set on packed images, describes the sources and settings used to make it.
+    pack_fingerprint: StringProperty(default = "")
     
 
 class PAK_ImageItem(PropertyGroup):
@@ -146,6 +150,120 @@ class PAK_ExportLocations(PropertyGroup):
         subtype = "FILE_PATH"
     )
 
+class PAK_PackRecipe(PropertyGroup):
+    """
+    A single image packing output.  Every enabled recipe is made from the same bundle 
+    sources while packing, so extra outputs don't need extra reads.
+    """
+
+    name: StringProperty(
+        name = "",
+        description = "The name of the pack recipe"
+    )
+
+    enabled: BoolProperty(
+        name = "",
+        description = "If disabled, this recipe won't be packed",
+        default = True,
+    )
+
+    pack_format: PointerProperty(type=PAK_ImageFormat)
+
+    pack_r_source: StringProperty(
+        name = "Red Source Slot Name",
+        description = "Set the name of the material slot that will be used as a source for the new image's red channel (if it can be found within a bundle).  Multiple slot names can be defined but only the first one found in a image bundle will be used",
+        default = ""
+    )
+
+    pack_g_source: StringProperty(
+        name = "Green Source Slot Name",
+        description = "Set the name of the material slot that will be used as a source for the new image's green channel (if it can be found within a bundle).  Multiple slot names can be defined but only the first one found in a image bundle will be used",
+        default = ""
+    )
+
+    pack_b_source: StringProperty(
+        name = "Blue Source Slot Name",
+        description = "Set the name of the material slot that will be used as a source for the new image's blue channel (if it can be found within a bundle).  Multiple slot names can be defined but only the first one found in a image bundle will be used",
+        default = ""
+    )
+
+    pack_a_source: StringProperty(
+        name = "Alpha Source Slot Name",
+        description = "Set the name of the material slot that will be used as a source for the new image's alpha channel (if it can be found within a bundle).  Multiple slot names can be defined but only the first one found in a image bundle will be used",
+        default = ""
+    )
+
+
+    pack_r_channel: EnumProperty(
+		name = " ",
+		items = (('R', "R", "Use the red channel from the source material slot as the new packed image's red channel"),
+			    ('G', "G", "Use the green channel from the source material slot as the new packed image's red channel"),
+			    ('B', "B", "Use the blue channel from the source material slot as the new packed image's red channel"),
+                ('A', "A", "Use the alpha channel from the source material slot as the new packed image's red channel")),
+		description = "",
+		default = 'R',
+	)
+
+    pack_g_channel: EnumProperty(
+		name = " ",
+		items = (('R', "R", "Use the red channel from the source material slot as the new packed image's green channel"),
+			    ('G', "G", "Use the green channel from the source material slot as the new packed image's green channel"),
+			    ('B', "B", "Use the blue channel from the source material slot as the new packed image's green channel"),
+                ('A', "A", "Use the alpha channel from the source material slot as the new packed image's green channel")),
+		description = "",
+		default = 'R',
+	)
+
+    pack_b_channel: EnumProperty(
+		name = " ",
+		items = (('R', "R", "Use the red channel from the source material slot as the new packed image's blue channel"),
+			    ('G', "G", "Use the green channel from the source material slot as the new packed image's blue channel"),
+			    ('B', "B", "Use the blue channel from the source material slot as the new packed image's blue channel"),
+                ('A', "A", "Use the alpha channel from the source material slot as the new packed image's blue channel")),
+		description = "",
+		default = 'R',
+	)
+
+    pack_a_channel: EnumProperty(
+		name = " ",
+		items = (('R', "R", "Use the red channel from the source material slot as the new packed image's alpha channel"),
+			    ('G', "G", "Use the green channel from the source material slot as the new packed image's alpha channel"),
+			    ('B', "B", "Use the blue channel from the source material slot as the new packed image's alpha channel"),
+                ('A', "A", "Use the alpha channel from the source material slot as the new packed image's alpha channel")),
+		description = "",
+		default = 'R',
+	)
+
+    pack_r_invert: BoolProperty(
+        name = "Invert R Source",
+        description = "Invert the source image output",
+        default = False,
+    )
+
+    pack_g_invert: BoolProperty(
+        name = "Invert G Source",
+        description = "Invert the source image output",
+        default = False,
+    )
+
+    pack_b_invert: BoolProperty(
+        name = "Invert B Source",
+        description = "Invert the source image output",
+        default = False,
+    )
+
+    pack_a_invert: BoolProperty(
+        name = "Invert A Source",
+        description = "Invert the source image output",
+        default = False,
+    )
+
+    packed_image_suffix: StringProperty(
+        name = "Packed Image Suffix",
+        description = "Set the suffix the new image will be given.  The base name of the new image will be the same as the base name for the Bundle",
+        default = "",
+    )
+
 class PAK_FileData(PropertyGroup):
     """
     Everything PakPal needs to preserve as part of the file.
@@ -179,11 +297,11 @@ class PAK_FileData(PropertyGroup):
         description = "If enabled, operations that use material slot names such as image packing and material bundling will perform material slot comparisons in a case sensitive manner"
     )
 
-    # The scene used to store Compositor nodes in.
+    # The scene used to store Compositor nodes in (see pipeline_scene.py).
     scene_data: PointerProperty(
         type = bpy.types.Scene,
         name = "PakPal Scene Data Source",
-        description = "Defines the scene used to store Compositor nodes used for managing Image Format settings"
+        description = "Defines the hidden scene used to store the Compositor nodes and Image Format settings used when exporting and packing images"
     )
 
     ## HIDDEN PROPERTIES
@@ -204,6 +322,10 @@ class PAK_FileData(PropertyGroup):
         update = PAK_Update_EnableBundles,
     )
 
+    # Measured from previous runs and used to estimate how long a run will take.
+    pack_seconds_per_megapixel: FloatProperty(default = 0.0)
+    export_seconds_per_megapixel: FloatProperty(default = 0.0)
+
     ## TEXTURE LIST OPTIONS
     # These appear in the dropdown
 
@@ -298,6 +420,15 @@ class PAK_FileData(PropertyGroup):
 
     pack_format: PointerProperty(type=PAK_ImageFormat)
 
+    use_pack_recipes: BoolProperty(
+        name = "Use Pack Recipes",
+        description = "Pack a list of recipes instead of a single image, each with their own sources and image format.  Every recipe for a bundle is made from a single read of its source images",
+        default = False,
+    )
+
+    pack_recipes: CollectionProperty(type = PAK_PackRecipe)
+    pack_recipes_list_index: IntProperty(default = 0)
+
     pack_r_source: StringProperty(
         name = "Red Source Slot Name",
         description = "Set the name of the material slot that will be used as a source for the new image's red channel (if it can be found within a bundle).  Multiple slot names can be defined but only the first one found in a image bundle will be used",
@@ -398,15 +529,115 @@ class PAK_FileData(PropertyGroup):
         default = True,
     )
 
+    force_export: BoolProperty(
+        name = "Force Export",
+        description = "Export every image, even if it hasn't changed since it was last exported to the same location",
+        default = False,
+    )
+
+    export_backend: EnumProperty(
+        name = "Export Backend",
+        items = (('COMPOSITOR', "In Blender", "Exports every image one at a time inside this Blender session"),
+                 ('THREAD', "Worker Threads", "Reads image pixels inside this Blender session and encodes them on worker threads.  Only PNG, BMP and Targa Raw formats can be encoded this way, other formats are exported inside Blender"),
+                 ('PROCESS', "Worker Processes", "Splits the export between background Blender processes that each open a copy of this file.  Much faster for large exports on machines with lots of cores, but each worker has to load the file first")),
+        default = 'COMPOSITOR',
+    )
+
+    export_worker_count: IntProperty(
+        name = "Export Workers",
+        description = "The number of worker threads or background Blender processes used to export images",
+        default = 4,
+        min = 1,
+        soft_max = 32,
+    )
+
+    force_image_pack: BoolProperty(
+        name = "Force Repack",
+        description = "Repack every image, even if it's sources and pack settings haven't changed since it was last packed",
+        default = False,
+    )
+
     add_fake_user: BoolProperty(
         name = "Add Fake User",
         description = "Adds a fake user to any generated packed images to prevent them from disappearing when the blend file is closed",
         default = True,
     )
 
+    pack_engine: EnumProperty(
+        name = "Pack Engine",
+        items = (('NUMPY', "Pixel Buffers", "Reads and packs image pixels directly.  This is much faster than the compositor, especially when packing lots of bundles"),
+                ('COMPOSITOR', "Compositor", "Builds and renders a compositor node tree for every bundle")),
+        description = "Set the method used to pack channels into new images",
+        default = 'NUMPY',
+    )
+
+    pack_cache_limit: IntProperty(
+        name = "Pixel Cache Limit",
+        description = "The amount of memory (in megabytes) that can be used to hold source image pixels while packing.  Images used by many channels or bundles are only read once if they fit in the cache",
+        min = 0,
+        soft_max = 32768,
+        subtype = 'UNSIGNED',
+        default = 2048,
+    )
+
+    pack_worker_count: IntProperty(
+        name = "Worker Threads",
+        description = "The number of threads used to pack and encode images while new sources are being read.  Only used for formats PakPal can encode itself (PNG, BMP and Targa RAW)",
+        min = 1,
+        soft_max = 32,
+        default = 4,
+    )
+
+    pack_tiled: BoolProperty(
+        name = "Tiled Packing",
+        description = "Pack and encode images in bands of rows, and only keep the source channels being packed.  This keeps memory use low when packing very large textures.  Only used for formats PakPal can encode itself (PNG, BMP and Targa RAW)",
+        default = False,
+    )
+
+    pack_tile_memory: IntProperty(
+        name = "Tile Memory Limit",
+        description = "The amount of memory (in megabytes) each worker thread can use for a band of rows when using Tiled Packing",
+        min = 1,
+        soft_max = 4096,
+        subtype = 'UNSIGNED',
+        default = 256,
+    )
+
+    pack_resolution_policy: EnumProperty(
+        name = "Mismatched Sizes",
+        items = (('LARGEST', "Upscale to Largest", "Resample every source to the size of the largest source in the bundle"),
+                ('SMALLEST', "Downscale to Smallest", "Resample every source to the size of the smallest source in the bundle"),
+                ('FIXED', "Fixed Size", "Resample every source to a fixed size")),
+        description = "Set how bundles with sources of different sizes are packed",
+        default = 'LARGEST',
+    )
+
+    pack_resolution: IntVectorProperty(
+        name = "Packed Size",
+        description = "The width and height of the packed image when using a Fixed Size",
+        size = 2,
+        min = 1,
+        default = (2048, 2048),
+    )
+
+    pack_resample_filter: EnumProperty(
+        name = "Resample Filter",
+        items = (('BOX', "Box", "Averages the pixels under each new pixel.  Fast and sharp, but blocky when upscaling"),
+                ('BILINEAR', "Bilinear", "Blends between neighbouring pixels"),
+                ('LANCZOS', "Lanczos", "The sharpest and slowest filter, best for downscaling detailed images")),
+        description = "Set the filter used to resample sources that don't match the size of the packed image",
+        default = 'BILINEAR',
+    )
+
+    pack_save_copy: BoolProperty(
+        name = "Save File Copy",
+        description = "Also save a copy of every packed image to the Save Location.  When disabled, packed images are created and stored in the blend file without being saved to disk first (except for formats PakPal can't encode itself)",
+        default = False,
+    )
+
     temp_bake_path: StringProperty(
-        name = "Temp Save Location",
-        description = "A temporary location used to save packed images.  Either due to Blender limitations or a skill issue, PakPal needs to save images somewhere before reloading and saving them in the blend file",
+        name = "Save Location",
+        description = "The location packed images are saved to when Save File Copy is enabled",
         default = "//Pak_Cache\\",
         subtype = "FILE_PATH"
     )
@@ -418,6 +649,7 @@ class PAK_MaterialSlot(PropertyGroup):
         name = "Bundle Text",
         description = "",
         default = "",
+        update = PAK_Update_MaterialSlotName,
     )
 
 
@@ -1,14 +1,28 @@
 
 import bpy, os
-from .material_slots import FindMaterialSlotInName
+from .material_slots import FindMaterialSlotInName, InvalidateSlotMatchers
 from .main_menu import CreatePakPreviewTexture
+from .bundle_index import selection_cache
+from .operators import RUNS_IN_PROGRESS
+from .handlers import RequestBundleRefresh
+
+def RefreshListWhenFree():
+    """
+    Refreshes the Texture List now, or once the running export or image pack has
+    finished with it.
+    """
+
+    if len(RUNS_IN_PROGRESS) > 0:
+        RequestBundleRefresh(force = True)
+    else:
+        bpy.ops.pak.refresh_images()
 
 def PAK_Update_RefreshList(self, context):
     """
     Triggers an update of the Texture List
     """
 
-    bpy.ops.pak.refresh_images()
+    RefreshListWhenFree()
     
     return
 
@@ -29,9 +43,8 @@ def PAK_Update_EnableExport(self, context):
     value = file_data.proxy_enable_export
 
     if file_data.enable_multiselect:
-        for bundle in file_data.bundles:
-            if bundle.is_selected:
-                bundle.enable_export = value
+        for bundle in selection_cache.get_bundles(file_data.bundles):
+            bundle.enable_export = value
 
     else:
         bundle = file_data.bundles[file_data.bundles_list_index].pak_items
@@ -57,9 +70,8 @@ def PAK_Update_ExportLocation(self, context):
     value = file_data.proxy_export_location
 
     if file_data.enable_multiselect:
-        for bundle in file_data.bundles:
-            if bundle.is_selected:
-                bundle.export_location = value
+        for bundle in selection_cache.get_bundles(file_data.bundles):
+            bundle.export_location = value
 
     else:
         bundle = file_data.bundles[file_data.bundles_list_index].pak_items
@@ -85,9 +97,8 @@ def PAK_Update_ExportFormat(self, context):
     value = file_data.proxy_export_format
 
     if file_data.enable_multiselect:
-        for bundle in file_data.bundles:
-            if bundle.is_selected:
-                bundle.export_format = value
+        for bundle in selection_cache.get_bundles(file_data.bundles):
+            bundle.export_format = value
 
     else:
         bundle = file_data.bundles[file_data.bundles_list_index].pak_items
@@ -96,13 +107,20 @@ def PAK_Update_ExportFormat(self, context):
 
     return None
 
+def PAK_Update_MaterialSlotName(self, context):
+    """
+    Makes sure images are matched against the new material slot name.
+    """
+
+    InvalidateSlotMatchers()
+
 def PAK_Update_EnableBundles(self, context):
     """
     Automatically refreshes the list when the Enable Bundles is toggled 
     in order to provide the right data.
     """
 
-    bpy.ops.pak.refresh_images()
+    RefreshListWhenFree()
 
 
 
@@ -119,6 +137,9 @@ def PAK_Update_TextureListItem_Name(self, context):
     except KeyError:
         return
     
+    # The selection is stored by name.
+    selection_cache.invalidate()
+
     if file_data.is_internal_update:
         return
     
@@ -213,6 +234,10 @@ def PAK_Update_TextureListItem_IsSelected(self, context):
     """
     Used to reset proxy export properties in the UI every time UI selection changes.
     """
+
+    # self in this context is the bundle being selected
+    selection_cache.set_selected(self)
+
     try:
         addon_prefs = context.preferences.addons[__package__].preferences
         file_data = bpy.data.objects[addon_prefs.pak_filedata_name].PAK_FileData